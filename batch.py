@@ -0,0 +1,220 @@
+#!/usr/bin/python
+
+'''
+Enigma Machine Simulation
+
+Details: This file holds a NumPy version of the Enigma machine that enciphers many settings at once. Each setting (rotor order, window key, plugboard) is a row in a set of arrays, the rotor offsets for every keystroke are computed in closed form, and each letter of every message goes through the plugboard, rotors and reflector as a handful of array lookups. The output matches machine.Enigma.encipher for every setting.
+
+Any of rotors I - VIII can be used. Ring settings are taken to be A and the reflector is B, as in the attacks that use this module.
+'''
+# Module imports.
+from itertools import permutations, product
+
+import numpy as np
+
+from components import ALPHABET
+from compiled import ROTOR_TABLES, REFLECTOR_TABLE, INVALID_CHARS, LETTER_CODES, core_tables
+import instrument
+from wheels import REGISTRY
+
+# Rotor names in the order used for the integer rotor ids below.
+ROTOR_NAMES = list(ROTOR_TABLES)
+
+# FORWARD[rotor id, offset, index] and BACKWARD[...] hold the compiled rotor tables as arrays.
+FORWARD = np.array([ROTOR_TABLES[rotor_num][0] for rotor_num in ROTOR_NAMES], dtype=np.uint8)
+BACKWARD = np.array([ROTOR_TABLES[rotor_num][1] for rotor_num in ROTOR_NAMES], dtype=np.uint8)
+REFLECTOR = np.array(REFLECTOR_TABLE, dtype=np.uint8)
+# NOTCHES[rotor id] holds the rotor's notch offsets, padded with -1 for rotors that only have one notch.
+NOTCHES = np.array([list(REGISTRY.rotors[rotor_num].notches) + [-1]*(2 - len(REGISTRY.rotors[rotor_num].notches))
+                    for rotor_num in ROTOR_NAMES], dtype=np.int64)
+# Every window key as rotor offsets, in the order of product(ALPHABET, repeat=3).
+ALL_KEYS = np.array(list(product(range(26), repeat=3)), dtype=np.int64)
+
+def order_ids(rotor_orders):
+    '''
+    Converts a list of rotor orders such as [['I', 'II', 'III'], ...] into an (N, 3) array of rotor ids.
+    '''
+    return np.array([[ROTOR_NAMES.index(rotor_num) for rotor_num in order] for order in rotor_orders], dtype=np.int64)
+
+def key_offsets(keys):
+    '''
+    Converts a list of three letter window keys into an (N, 3) array of rotor offsets.
+    '''
+    return np.array([[ALPHABET.index(letter) for letter in key.upper()] for key in keys], dtype=np.int64)
+
+def plug_tables(swaps_list):
+    '''
+    Converts a list of plugboard settings (each None or a list of swaps such as [('A', 'B')]) into an (N, 26) array of letter permutations.
+    '''
+    plugs = np.tile(np.arange(26, dtype=np.uint8), (len(swaps_list), 1))
+    for n, swaps in enumerate(swaps_list):
+        if swaps != None:
+            for swap in swaps:
+                a, b = ALPHABET.index(swap[0].upper()), ALPHABET.index(swap[1].upper())
+                plugs[n, a], plugs[n, b] = b, a
+    return plugs
+
+def all_settings(rotors=['I', 'II', 'III']):
+    '''
+    Returns (keys, orders) arrays covering every window key and every ordering of the given rotors, in the same order that rejewski.make_chain_length_dict visits them.
+    '''
+    orders = order_ids(list(permutations(rotors)))
+    return np.repeat(ALL_KEYS, len(orders), axis=0), np.tile(orders, (len(ALL_KEYS), 1))
+
+def rotor_offsets(keys, orders, length):
+    '''
+    Computes the rotor offsets used for each of the first length keystrokes of every setting.
+
+    Returns three (N, length) arrays of offsets for the left, middle and right rotors.
+    '''
+    return offsets_at(keys, orders, np.arange(1, length + 1, dtype=np.int64))
+
+def offsets_at(keys, orders, steps):
+    '''
+    Computes the rotor offsets of every setting at the given keystroke numbers (1 is the first letter of a message).
+
+    The left rotor moves on every keystroke and carries into the middle rotor when it steps off its notch, which carries into the right rotor in the same way (see Rotor.step). The number of carries after t steps can therefore be counted directly instead of replaying the steps.
+
+    Returns three (N, len(steps)) arrays of offsets for the left, middle and right rotors.
+    '''
+    steps = np.asarray(steps, dtype=np.int64)
+    l_start, m_start, r_start = keys[:, 0:1], keys[:, 1:2], keys[:, 2:3]
+    m_steps = carries(l_start, NOTCHES[orders[:, 0]], steps)
+    r_steps = carries(m_start, NOTCHES[orders[:, 1]], m_steps)
+    return (l_start + steps)%26, (m_start + m_steps)%26, (r_start + r_steps)%26
+
+def carries(start, notches, steps):
+    '''
+    Counts how often rotors starting at the (N, 1) offsets start step off a notch, and so carry, during steps moves.
+    notches = (N, 2) array of notch offsets from NOTCHES.
+    '''
+    # If a rotor is a steps away from a notch, it carries on its moves a+1, a+27, a+53, ...
+    count = (steps + 25 - (notches[:, 0:1] - start)%26)//26
+    second = notches[:, 1:2]
+    return count + np.where(second >= 0, (steps + 25 - (second - start)%26)//26, 0)
+
+def scrambler_tables_at(keys, orders, steps):
+    '''
+    Computes the scrambler (rotors and reflector, no plugboard) of every setting at the given keystroke numbers.
+
+    Returns an (N, len(steps), 26) uint8 array: entry [n, s, x] is what letter x becomes at keystroke steps[s] of setting n.
+    '''
+    keys = np.asarray(keys, dtype=np.int64)
+    orders = np.asarray(orders, dtype=np.int64)
+    l, m, r = [offsets[:, :, None] for offsets in offsets_at(keys, orders, steps)]
+    l_rotor, m_rotor, r_rotor = orders[:, 0, None, None], orders[:, 1, None, None], orders[:, 2, None, None]
+    x = np.arange(26, dtype=np.uint8)[None, None, :]
+    x = FORWARD[l_rotor, l, x]
+    x = FORWARD[m_rotor, m, x]
+    x = FORWARD[r_rotor, r, x]
+    x = REFLECTOR[x]
+    x = BACKWARD[r_rotor, r, x]
+    x = BACKWARD[m_rotor, m, x]
+    return BACKWARD[l_rotor, l, x]
+
+def scramble(keys, orders, steps, codes):
+    '''
+    Sends single letters through the scrambler (rotors and reflector, no plugboard), element by element.
+
+    keys = (M, 3) array of rotor offsets, orders = (M, 3) or (1, 3) array of rotor ids, steps = keystroke number (1 is the first letter) as a scalar or length M array, codes = length M array of letter indices.
+
+    Returns a length M uint8 array. Unlike scrambler_tables_at, the cost only depends on how many letters are asked for.
+    '''
+    keys = np.asarray(keys, dtype=np.int64)
+    orders = np.asarray(orders, dtype=np.int64)
+    l, m, r = [offsets[:, 0] for offsets in offsets_at(keys, orders, np.reshape(steps, (-1, 1)))]
+    l_rotor, m_rotor, r_rotor = orders[:, 0], orders[:, 1], orders[:, 2]
+    x = FORWARD[l_rotor, l, codes]
+    x = FORWARD[m_rotor, m, x]
+    x = FORWARD[r_rotor, r, x]
+    x = REFLECTOR[x]
+    x = BACKWARD[r_rotor, r, x]
+    x = BACKWARD[m_rotor, m, x]
+    return BACKWARD[l_rotor, l, x]
+
+def order_tables(rotor_order):
+    '''
+    Builds the lookup tables for sweeping every position of one rotor order with no plugboard. A rotor state is numbered s = l*676 + m*26 + r, the same numbering as ALL_KEYS.
+
+    Returns (scrambler, successor): scrambler[s, c] is what letter c becomes in state s, and successor[s] is the state after one keystroke. The scrambler is put together from the shared compiled.core_tables for the middle and right rotors.
+    '''
+    l_forward, l_backward = [np.array(table, dtype=np.uint8) for table in ROTOR_TABLES[rotor_order[0]]]
+    cores = np.array(core_tables(rotor_order[1], rotor_order[2]), dtype=np.uint8)
+    l, m, r = [offsets[:, None] for offsets in ALL_KEYS.T]
+    scrambler = l_backward[l, cores[m*26 + r, l_forward[l, np.arange(26)]]]
+    # The rotors step as in Rotor.step: the left rotor always, the others when the rotor before them leaves a notch.
+    l, m, r = ALL_KEYS.T
+    l_turnover = np.isin(l, REGISTRY.rotors[rotor_order[0]].notches)
+    m_turnover = np.isin(m, REGISTRY.rotors[rotor_order[1]].notches)
+    successor = ((l + 1)%26)*676 + np.where(l_turnover, (m + 1)%26, m)*26 + np.where(l_turnover & m_turnover, (r + 1)%26, r)
+    return scrambler, successor
+
+def encipher_codes_batch(keys, orders, plugs, codes):
+    '''
+    Enciphers an (N, L) array of letter indices (0-25), one row per setting.
+
+    keys = (N, 3) array of rotor offsets (see key_offsets).
+    orders = (N, 3) array of rotor ids (see order_ids).
+    plugs = (N, 26) array of plugboard permutations (see plug_tables), or None for no plugboard.
+    codes = (N, L) array of letter indices, or a length L array to encipher the same message under every setting.
+
+    Returns an (N, L) uint8 array of letter indices.
+    '''
+    keys = np.asarray(keys, dtype=np.int64)
+    orders = np.asarray(orders, dtype=np.int64)
+    codes = np.asarray(codes, dtype=np.uint8)
+    count = len(keys)
+    if codes.ndim == 1:
+        codes = np.broadcast_to(codes, (count, len(codes)))
+    if instrument.enabled:
+        instrument.count('letters', codes.size)
+    l, m, r = rotor_offsets(keys, orders, codes.shape[1])
+    rows = np.arange(count)[:, None]
+    l_rotor, m_rotor, r_rotor = orders[:, 0:1], orders[:, 1:2], orders[:, 2:3]
+    x = codes if plugs is None else plugs[rows, codes]
+    x = FORWARD[l_rotor, l, x]
+    x = FORWARD[m_rotor, m, x]
+    x = FORWARD[r_rotor, r, x]
+    x = REFLECTOR[x]
+    x = BACKWARD[r_rotor, r, x]
+    x = BACKWARD[m_rotor, m, x]
+    x = BACKWARD[l_rotor, l, x]
+    return x if plugs is None else plugs[rows, x]
+
+def encipher_batch(keys, rotor_orders, messages, swaps=None):
+    '''
+    Enciphers messages under many Enigma settings in one call.
+
+    keys = List of N three letter window keys such as ['AAA', 'TDS'].
+    rotor_orders = List of N rotor orders, or a single order such as ['I', 'II', 'III'] to use for every key.
+    messages = List of N messages, or a single message to encipher under every setting.
+    swaps = None, a single plugboard setting such as [('A', 'B')] for every key, or a list of N plugboard settings.
+
+    Returns a list of N ciphertexts, each identical to what Enigma(key, swaps, rotor_order).encipher(message) returns.
+    '''
+    count = len(keys)
+    if isinstance(rotor_orders[0], str):
+        rotor_orders = [rotor_orders]*count
+    if isinstance(messages, str):
+        messages = [messages]*count
+    if swaps == None or all(isinstance(swap, (str, tuple)) for swap in swaps):
+        swaps = [swaps]*count
+    results = [None]*count
+    texts = []
+    for n, message in enumerate(messages):
+        if INVALID_CHARS.search(message):
+            results[n] = 'Please provide a string containing only the characters a-zA-Z and spaces.'
+            texts.append(b'')
+        else:
+            texts.append(message.upper().replace(' ', '').strip().encode('ascii').translate(LETTER_CODES))
+    # Pad the messages to a common length; the padding is enciphered and then dropped.
+    length = max([len(text) for text in texts] + [0])
+    codes = np.zeros((count, length), dtype=np.uint8)
+    for n, text in enumerate(texts):
+        codes[n, :len(text)] = np.frombuffer(text, dtype=np.uint8)
+    cipher = encipher_codes_batch(key_offsets(keys), order_ids(rotor_orders), plug_tables(swaps), codes)
+    letters = (cipher + ord('A')).astype(np.uint8)
+    for n, text in enumerate(texts):
+        if results[n] is None:
+            results[n] = letters[n, :len(text)].tobytes().decode('ascii')
+    return results
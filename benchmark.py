@@ -0,0 +1,185 @@
+#! /usr/bin/python
+"""
+Benchmark suite for the Enigma simulator and the Rejewski attack code.
+
+Every benchmark is seeded and runs offline. Each one is timed over several repeats (the median is reported) and then run once more under tracemalloc to record its peak memory. Results are written as JSON and, if a baseline file exists, compared against it so that a drop in throughput beyond the tolerance is flagged as a regression.
+
+Usage:
+    python benchmark.py                      # run everything, compare with benchmark_baseline.json if present
+    python benchmark.py -o results.json      # also save the results
+    python benchmark.py --save-baseline      # store the results as the new baseline
+    python benchmark.py -b encipher          # only run benchmarks whose name contains 'encipher'
+"""
+# Import helpful tools
+import argparse
+import json
+import platform
+import random as r
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Import enigma stuff
+import machine
+import rejewski
+
+ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+BASELINE = './benchmark_baseline.json'
+
+def random_message(length, seed=0):
+    '''
+    Returns a reproducible random message of uppercase letters.
+    '''
+    rng = r.Random(seed)
+    return ''.join(rng.choice(ALPHABET) for i in range(length))
+
+def bench_encode_decode_letter(count=20000):
+    enigma = machine.Enigma()
+    letters = random_message(count)
+    def run():
+        enigma.set_rotor_position('AAA')
+        for letter in letters:
+            enigma.encode_decode_letter(letter)
+    return run, count, 'letters'
+
+def bench_encipher(length, compiled=False):
+    def setup():
+        enigma = machine.Enigma('TDS', [('J', 'S'), ('H', 'Y'), ('N', 'F')], ['II', 'I', 'III'], compiled=compiled)
+        message = random_message(length)
+        def run():
+            enigma.set_rotor_position('TDS')
+            enigma.encipher(message)
+        return run, length, 'letters'
+    return setup
+
+def bench_settings_churn(count=2000):
+    enigma = machine.Enigma()
+    rng = r.Random(1)
+    orders = [rng.sample(['I', 'II', 'III', 'V'], 3) for i in range(count)]
+    keys = [random_message(3, seed=i) for i in range(count)]
+    def run():
+        for order, key in zip(orders, keys):
+            enigma.set_rotor_order(order)
+            enigma.set_rotor_position(key)
+    return run, count, 'settings'
+
+def bench_make_messages(count=500):
+    def run():
+        r.seed(2)
+        rejewski.make_messages(rejewski.SECRET_DAY_KEY, rejewski.SECRET_SWAPS, rejewski.SECRET_ROTOR_ORDER, count)
+    return run, count, 'indicators'
+
+def bench_generate_permutation_dicts(count=500):
+    r.seed(3)
+    messages = rejewski.make_messages(rejewski.SECRET_DAY_KEY, rejewski.SECRET_SWAPS, rejewski.SECRET_ROTOR_ORDER, count)
+    def run():
+        rejewski.generate_permutation_dicts(messages)
+    return run, count, 'indicators'
+
+def bench_make_chains_from_permutation_dict(count=200):
+    r.seed(4)
+    messages = rejewski.make_messages(rejewski.SECRET_DAY_KEY, rejewski.SECRET_SWAPS, rejewski.SECRET_ROTOR_ORDER, 1000)
+    permutation_dicts = rejewski.generate_permutation_dicts(messages)
+    def run():
+        for i in range(count):
+            rejewski.make_chains_from_permutation_dict(permutation_dicts)
+    return run, count, 'permutation sets'
+
+def bench_chain_catalog_slice():
+    # One of the 26 slices make_chain_length_dict hands to its workers: 676 day keys x 6 rotor orders.
+    def run():
+        with tempfile.TemporaryDirectory() as parts_dir:
+            rejewski.build_chain_chunk(0, ['I', 'II', 'III'], parts_dir)
+    return run, 676*6, 'key/order combinations'
+
+# Name -> function returning (run, units processed per run, unit name).
+BENCHMARKS = {
+    'encode_decode_letter': bench_encode_decode_letter,
+    'encipher_100': bench_encipher(100),
+    'encipher_1000': bench_encipher(1000),
+    'encipher_10000': bench_encipher(10000),
+    'encipher_compiled_10000': bench_encipher(10000, compiled=True),
+    'encipher_compiled_1000000': bench_encipher(1000000, compiled=True),
+    'set_rotor_order_position_churn': bench_settings_churn,
+    'make_messages': bench_make_messages,
+    'generate_permutation_dicts': bench_generate_permutation_dicts,
+    'make_chains_from_permutation_dict': bench_make_chains_from_permutation_dict,
+    'make_chain_length_dict_slice': bench_chain_catalog_slice,
+}
+
+def run_benchmark(setup, repeat=5):
+    '''
+    Times one benchmark and measures its peak memory. Returns a result dictionary.
+    '''
+    run, count, unit = setup()
+    # Warm up caches (compiled tables, imports) before timing.
+    run()
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    # Memory is measured in a separate run since tracemalloc slows everything down.
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    median = statistics.median(times)
+    return {'unit': unit, 'count': count, 'repeat': repeat, 'median_seconds': median, 'best_seconds': min(times),
+            'throughput': count/median, 'peak_memory_bytes': peak}
+
+def compare(results, baseline, tolerance):
+    '''
+    Returns a list of (name, baseline throughput, current throughput) for every benchmark that slowed down by more than tolerance.
+    '''
+    regressions = []
+    for name, result in results['benchmarks'].items():
+        if name in baseline.get('benchmarks', {}):
+            expected = baseline['benchmarks'][name]['throughput']
+            if result['throughput'] < expected*(1 - tolerance):
+                regressions.append((name, expected, result['throughput']))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Enigma simulator and the Rejewski pipeline.')
+    parser.add_argument('-b', '--bench', action='append', default=[], help='only run benchmarks containing this text')
+    parser.add_argument('-o', '--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline JSON to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='fractional throughput drop that counts as a regression (default 0.25)')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per benchmark')
+    args = parser.parse_args(argv)
+
+    results = {'python': platform.python_version(), 'platform': platform.platform(),
+               'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'benchmarks': {}}
+    for name, setup in BENCHMARKS.items():
+        if args.bench and not any(text in name for text in args.bench):
+            continue
+        result = run_benchmark(setup, args.repeat)
+        results['benchmarks'][name] = result
+        print('%-36s %14.1f %s/s  %10.4f s  peak %8.1f KiB' % (name, result['throughput'], result['unit'],
+              result['median_seconds'], result['peak_memory_bytes']/1024.0))
+
+    if args.output:
+        json.dump(results, open(args.output, 'w'), indent=2)
+    if args.save_baseline:
+        json.dump(results, open(args.baseline, 'w'), indent=2)
+        print('Baseline saved to ' + args.baseline)
+        return 0
+    try:
+        baseline = json.load(open(args.baseline))
+    except FileNotFoundError:
+        print('No baseline at ' + args.baseline + '; run with --save-baseline to create one.')
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    for name, expected, actual in regressions:
+        print('REGRESSION %s: %.1f -> %.1f per second' % (name, expected, actual))
+    if not regressions:
+        print('No regressions against ' + args.baseline)
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+#! /usr/bin/python
+"""
+Module containing a software version of the Turing-Welchman Bombe: a known-plaintext (crib) attack that, unlike the Rejewski attack in rejewski.py, does not need the doubled message key.
+
+Outline:
+
+- Line the crib up with the ciphertext. Each crib letter p and ciphertext letter c at keystroke t give an edge p - c of the "menu". Since Enigma never enciphers a letter to itself, offsets where p == c anywhere are impossible.
+- If P is the plugboard and S_t the scrambler at keystroke t, then P(c) = S_t(P(p)). So once the plugboard partner of one menu letter is guessed, every edge fixes the partner of the next letter.
+- For each rotor order, every start position and every guess for the test letter are propagated through the menu together as NumPy arrays. A guess dies as soon as a loop in the menu gives a letter two different partners, or the partners stop forming a valid set of swaps. Loop edges are checked as early as possible so most guesses are dropped after a few lookups.
+- The smaller components of the menu are run the same way on top of the survivors, each with its own test letter guess, so their constraints are not lost.
+- Whatever survives is a "stop": a rotor order, start position and the plugboard pairs the menu implies.
+
+The scrambler tables come from batch.py, which follows the wiring and stepping of machine.Enigma exactly.
+"""
+# Import helpful tools
+from itertools import permutations
+from multiprocessing import Pool
+
+import numpy as np
+
+# Import enigma stuff
+from components import ROTOR_WIRINGS, ALPHABET
+from compiled import normalize_message
+import batch
+
+def make_menu(crib, ciphertext, offset=0):
+    '''
+    Builds the menu for a crib placed offset letters into the ciphertext.
+
+    Returns a list of edges (crib letter, cipher letter, keystroke) as letter indices, where keystroke 1 is the first letter of the message.
+    Raises ValueError if the crib does not fit or places a letter on itself.
+    '''
+    crib = normalize_message(crib)
+    ciphertext = normalize_message(ciphertext)
+    if crib is None or ciphertext is None:
+        raise ValueError('Please provide strings containing only the characters a-zA-Z and spaces.')
+    if offset < 0 or offset + len(crib) > len(ciphertext):
+        raise ValueError('The crib does not fit in the ciphertext at offset ' + str(offset) + '.')
+    edges = []
+    for j, (p, c) in enumerate(zip(crib, ciphertext[offset:offset + len(crib)])):
+        if p == c:
+            raise ValueError('Enigma never enciphers a letter to itself, so the crib cannot sit at offset ' + str(offset) + '.')
+        edges.append((p, c, offset + j + 1))
+    return edges
+
+def possible_offsets(crib, ciphertext):
+    '''
+    Returns every offset where the crib could sit, i.e. where no crib letter lines up with the same ciphertext letter.
+    '''
+    crib = normalize_message(crib)
+    ciphertext = normalize_message(ciphertext)
+    return [offset for offset in range(len(ciphertext) - len(crib) + 1)
+            if all(p != c for p, c in zip(crib, ciphertext[offset:offset + len(crib)]))]
+
+def menu_components(edges):
+    '''
+    Splits a menu into connected components, the ones with the most loops first and then the largest (by number of edges).
+    Returns a list of (letters, edges) pairs.
+    '''
+    components = []
+    remaining = list(edges)
+    while remaining:
+        letters = {remaining[0][0], remaining[0][1]}
+        component = []
+        grown = True
+        while grown:
+            grown = False
+            for edge in list(remaining):
+                if edge[0] in letters or edge[1] in letters:
+                    letters.update(edge[:2])
+                    component.append(edge)
+                    remaining.remove(edge)
+                    grown = True
+        components.append((letters, component))
+    # A component of n letters and e edges has e - n + 1 independent loops.
+    components.sort(key=lambda component: (len(component[1]) - len(component[0]), len(component[1])), reverse=True)
+    return components
+
+def menu_loop_count(edges):
+    '''
+    Number of independent loops in a menu. A menu without loops cannot rule out any start position, only plugboard guesses.
+    '''
+    return sum(len(component) - len(letters) + 1 for letters, component in menu_components(edges))
+
+def consistent_partner(partner, letter):
+    '''
+    Boolean array marking the guesses where the newly found partner of letter is a valid swap alongside every partner found so far.
+    '''
+    keep = np.ones(len(partner[letter]), dtype=bool)
+    for c in partner:
+        if c != letter:
+            keep &= partner[letter] != partner[c]
+            keep &= (partner[letter] != c) | (partner[c] == letter)
+            keep &= (partner[c] != letter) | (partner[letter] == c)
+    return keep
+
+def propagate(keys, order, start, partner, edges):
+    '''
+    Runs one component of a menu for every surviving guess, dropping the guesses it contradicts.
+
+    start = start position number of each guess, partner = letter -> array of plugboard partners, one per guess; the component's test letter must already be in partner. Returns the surviving (start, partner) and the positions of the survivors in the input.
+    '''
+    survivors = np.arange(len(start))
+    unused = list(edges)
+    while unused and len(start):
+        # Prefer an edge that closes a loop, since it is the one that can prune.
+        closing = [edge for edge in unused if edge[0] in partner and edge[1] in partner]
+        edge = closing[0] if closing else next(edge for edge in unused if edge[0] in partner or edge[1] in partner)
+        unused.remove(edge)
+        a, b = (edge[0], edge[1]) if edge[0] in partner else (edge[1], edge[0])
+        # Only the guesses still alive are sent through the scrambler.
+        values = batch.scramble(keys[start], order, edge[2], partner[a])
+        if b in partner:
+            keep = values == partner[b]
+        else:
+            partner[b] = values
+            keep = consistent_partner(partner, b)
+        start = start[keep]
+        survivors = survivors[keep]
+        partner = {letter: values[keep] for letter, values in partner.items()}
+    return start, partner, survivors
+
+def extend_guesses(keys, order, start, partner, letters, component, keep_pairs):
+    '''
+    Tries 26 guesses for the test letter of one more menu component on top of every guess in (start, partner) and runs the component.
+
+    With keep_pairs the surviving extended guesses are returned; otherwise each original guess is kept, without the component's pairs, if at least one of its extensions survives.
+    '''
+    # The test letter is the one on the most edges.
+    test_letter = max(letters, key=lambda letter: sum(letter in edge[:2] for edge in component))
+    # Which guess each of the 26 new ones came from.
+    origin = np.repeat(np.arange(len(start)), 26)
+    guesses = {letter: values[origin] for letter, values in partner.items()}
+    guesses[test_letter] = np.tile(np.arange(26, dtype=np.uint8), len(start))
+    keep = consistent_partner(guesses, test_letter)
+    origin = origin[keep]
+    guesses = {letter: values[keep] for letter, values in guesses.items()}
+    found_start, guesses, survivors = propagate(keys, order, start[origin], guesses, component)
+    if keep_pairs:
+        return found_start, guesses
+    alive = np.unique(origin[survivors])
+    return start[alive], {letter: values[alive] for letter, values in partner.items()}
+
+def search_order(rotor_order, edges, max_guesses=1 << 20):
+    '''
+    Runs the menu against every start position of one rotor order.
+
+    Every connected component of the menu is used. The one with the most loops starts from 26 guesses for its test letter at each start position; each further component then tries 26 guesses for its own test letter on top of every guess still alive. A component with loops can rule guesses out and adds the pairs it fixes to the stop. A further component without loops only has to have at least one guess that fits the plugboard found so far, and its many possible pairs are left out.
+
+    max_guesses = most guesses held at once; survivors are extended in blocks of max_guesses / 26 so memory stays bounded however weak the menu is.
+
+    Returns a list of stops (rotor order, start position, plugboard pairs), the pairs given as strings such as 'AB'.
+    '''
+    keys = batch.ALL_KEYS
+    order = batch.order_ids([rotor_order])
+    block = max(1, max_guesses//26)
+    # Each surviving guess is a start position plus the plugboard partner of every menu letter reached so far.
+    start = np.arange(len(keys))
+    partner = {}
+    for letters, component in menu_components(edges):
+        # A tree of n letters has n - 1 edges and no loops.
+        keep_pairs = len(component) >= len(letters) or not partner
+        found = [extend_guesses(keys, order, start[first:first + block],
+                                {letter: values[first:first + block] for letter, values in partner.items()},
+                                letters, component, keep_pairs)
+                 for first in range(0, len(start), block)]
+        start = np.concatenate([found_start for found_start, found_partner in found])
+        partner = {letter: np.concatenate([found_partner[letter] for found_start, found_partner in found])
+                   for letter in found[0][1]}
+        if not len(start):
+            break
+    stops = []
+    for i, n in enumerate(start):
+        pairs = sorted(set(''.join(sorted(ALPHABET[letter] + ALPHABET[partner[letter][i]]))
+                           for letter in partner if partner[letter][i] != letter))
+        stops.append((list(rotor_order), ''.join(ALPHABET[k] for k in keys[n]), pairs))
+    return stops
+
+def _search_task(task):
+    rotor_order, offset, edges = task
+    return [(offset,) + stop for stop in search_order(rotor_order, edges)]
+
+def crib_search(ciphertext, crib, offset=None, rotors=list(ROTOR_WIRINGS), workers=None, max_stops=10000):
+    '''
+    Searches every rotor order and start position for settings consistent with a crib.
+
+    ciphertext = the intercepted message.
+    crib = plaintext believed to appear in the message.
+    offset = where the crib starts in the message, or None to try every offset the no-self-encryption rule allows.
+    rotors = the rotors to draw the three-rotor orders from (all of ROTOR_WIRINGS by default, i.e. the 336 orders of rotors I - VIII).
+    workers = number of processes (defaults to the number of CPUs, 1 runs everything in this process).
+    max_stops = stop searching once this many stops have been found (None for no limit).
+
+    Offsets whose menu has no loop are skipped, since nearly every start position would be a stop; ValueError is raised if no offset has a loop.
+
+    Returns a list of stops (offset, rotor order, start position, plugboard pairs), in offset and rotor order order.
+    '''
+    offsets = possible_offsets(crib, ciphertext) if offset is None else [offset]
+    menus = [(o, make_menu(crib, ciphertext, o)) for o in offsets]
+    menus = [(o, edges) for o, edges in menus if menu_loop_count(edges) > 0]
+    if not menus:
+        raise ValueError('The menu has no loops, so it cannot rule out any start position. Please use a longer crib.')
+    tasks = [(list(order), o, edges) for o, edges in menus for order in permutations(rotors, 3)]
+    stops = []
+    def collect(results):
+        for found in results:
+            stops.extend(found)
+            if max_stops is not None and len(stops) >= max_stops:
+                del stops[max_stops:]
+                return
+    if workers == 1:
+        collect(map(_search_task, tasks))
+    else:
+        # Leaving the with block terminates the pool, which abandons the remaining orders after an early stop.
+        with Pool(workers) as pool:
+            collect(pool.imap(_search_task, tasks))
+    return stops
@@ -0,0 +1,106 @@
+#! /usr/bin/python
+"""
+Module containing code to test the (day key, rotor order) candidates returned by a chains dictionary lookup.
+
+The messages are not sent at the day key: as in the notebooks, the day key only enciphers the doubled message key (the six-letter indicator, e.g. 'ZEUATW'), and every message is sent at the message key. So each candidate first deciphers the indicator at its day key and rotor order, and then deciphers the messages at the message key that comes out. The message key is only right if its letters are unplugged or the plugs are given, just as the notebooks need the plugboard before test_putative_key reads anything.
+
+The notebooks' test_putative_key reads encrypt1.txt - encrypt3.txt again for each candidate and prints the decryptions for a person to read. Here the ciphertexts are loaded once, handed to every worker of a process pool when it starts, and each candidate's decryptions are scored automatically (see scoring.py). The result is a ranked list, and the search can stop as soon as one candidate scores above a confidence threshold.
+"""
+# Import helpful tools
+from functools import partial
+from multiprocessing import Pool
+
+# Import enigma stuff
+from compiled import CompiledEnigma
+import instrument
+import scoring
+
+CIPHERTEXT_FILES = ['encrypt1.txt', 'encrypt2.txt', 'encrypt3.txt']
+
+def load_ciphertexts(paths=CIPHERTEXT_FILES):
+    '''
+    Reads the ciphertext files once and returns their contents as a list of strings.
+    '''
+    ciphertexts = []
+    for path in paths:
+        with open(path, 'r') as f:
+            ciphertexts.append(f.read().strip())
+    return ciphertexts
+
+def score_candidate(candidate, indicator, ciphertexts, plugs=None, scorer='ioc'):
+    '''
+    Recovers the message key with one candidate setting, deciphers every ciphertext at it and scores the combined plaintext.
+
+    candidate = (day key, order) as stored in chains_dict, e.g. (('Y', 'A', 'Q'), ('II', 'I', 'III')).
+    indicator = the six-letter doubled message key encryption the messages were sent under, e.g. 'ZEUATW'.
+
+    Returns (score, day key string, order list, message key, list of plaintexts).
+    '''
+    key, order = candidate
+    key = ''.join(key)
+    engine = CompiledEnigma(key, plugs, order)
+    message_key = engine.decipher(indicator)[:3]
+    plaintexts = []
+    for ciphertext in ciphertexts:
+        # Each message is sent from the message key's position, as in test_putative_key.
+        engine.set_rotor_position(message_key)
+        plaintexts.append(engine.decipher(ciphertext))
+    return scoring.SCORERS[scorer](''.join(plaintexts)), key, list(order), message_key, plaintexts
+
+# Set in each worker by _init_worker so the ciphertexts are sent once per process, not once per candidate.
+_worker_ciphertexts = None
+
+def _init_worker(ciphertexts):
+    global _worker_ciphertexts
+    _worker_ciphertexts = ciphertexts
+
+def _score_in_worker(candidate, indicator, plugs, scorer):
+    return score_candidate(candidate, indicator, _worker_ciphertexts, plugs, scorer)
+
+def rank_candidates(candidates, indicator, ciphertexts=None, plugs=None, scorer='ioc', threshold=None, workers=None, chunksize=8):
+    '''
+    Scores every candidate and returns them ranked from best to worst.
+
+    candidates = list of (key, order) pairs, e.g. chains_dict[index] or a ChainCatalog lookup.
+    indicator = the six-letter indicator of the messages, i.e. the message key enciphered twice at the day key.
+    ciphertexts = list of ciphertext strings (defaults to the contents of encrypt1.txt - encrypt3.txt).
+    plugs = plugboard swaps to decipher with, if any are known.
+    scorer = 'ioc' (index of coincidence) or 'fitness' (English letter fitness).
+    threshold = if set, stop as soon as a candidate scores at least this much. Only the candidates scored up to that point are returned.
+    workers = number of processes (defaults to the number of CPUs, 1 scores everything in this process).
+
+    Returns a list of (score, day key string, order list, message key, plaintexts).
+    '''
+    if ciphertexts is None:
+        ciphertexts = load_ciphertexts()
+    results = []
+    with instrument.timer('candidates.rank'):
+        if workers == 1:
+            for candidate in candidates:
+                results.append(score_candidate(candidate, indicator, ciphertexts, plugs, scorer))
+                if instrument.enabled:
+                    instrument.count('candidates.tested')
+                if threshold is not None and results[-1][0] >= threshold:
+                    break
+        else:
+            task = partial(_score_in_worker, indicator=indicator, plugs=plugs, scorer=scorer)
+            # Leaving the with block terminates the pool, which abandons the remaining work after an early stop.
+            with Pool(workers, initializer=_init_worker, initargs=(ciphertexts,)) as pool:
+                for result in pool.imap_unordered(task, candidates, chunksize):
+                    results.append(result)
+                    if instrument.enabled:
+                        instrument.count('candidates.tested')
+                    if threshold is not None and result[0] >= threshold:
+                        break
+    results.sort(key=lambda result: result[0], reverse=True)
+    return results
+
+def print_ranked(results, count=5):
+    '''
+    Prints the best few candidates and their decryptions, like test_putative_key does.
+    '''
+    for score, key, order, message_key, plaintexts in results[:count]:
+        print('Score %.4f, day key: %s, rotor order: %s, message key: %s' % (score, key, str(order), message_key))
+        for plaintext in plaintexts:
+            print(plaintext)
+        print('\n')
@@ -0,0 +1,248 @@
+#! /usr/bin/python
+"""
+Module containing a compact, memory-mapped file format for the chains dictionary built by rejewski.make_chain_length_dict.
+
+Loading chains.pickle deserializes every index string and every candidate tuple into each process. A catalog file instead stores:
+
+- a small header listing the distinct AD/BE/CF cycle signatures (e.g. '6677') and the rotor orders,
+- a sorted array of index codes, where each index string is packed into one integer from its three signature numbers,
+- a flat array of fixed-width candidate records (window key number and rotor order number).
+
+The file is opened with mmap and searched in place, so a lookup starts instantly and every process reading the same file shares one copy in the page cache.
+
+write_mapped_file and MappedFile hold the file layout shared with zygalski.py: an 8 byte magic string, the length of a JSON header, the header padded to 4 bytes, then little-endian uint32 arrays.
+"""
+# Import helpful tools
+from itertools import product
+import json
+import mmap
+import os
+import pickle
+import struct
+
+import numpy as np
+
+MAGIC = b'ENIGCAT2'
+ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+# Three letter window keys, numbered in the order of product(ALPHABET, repeat=3).
+KEYS = [''.join(key) for key in product(ALPHABET, repeat=3)]
+# Bits reserved for each signature number in an index code, and for the order number in a record.
+# Cycles of AD, BE and CF come in pairs of equal length, so there are at most 101 signatures (the partitions of 13), and three-rotor orders from rotors I - VIII number 336; a record (15 key bits and the order) fits in 32 bits.
+SIGNATURE_BITS = 10
+ORDER_BITS = 9
+
+def write_mapped_file(path, magic, header, arrays):
+    '''
+    Writes a memory-mappable file: magic, a JSON header and then each array as little-endian uint32.
+    '''
+    header = json.dumps(header).encode('utf-8')
+    # Pad the header so the arrays that follow are 4-byte aligned.
+    header += b' '*(-(len(magic) + 4 + len(header))%4)
+    # Write to a temporary name first so an interrupted run never leaves a truncated file behind.
+    with open(path + '.tmp', 'wb') as f:
+        f.write(magic)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        for array in arrays:
+            f.write(np.asarray(array).astype('<u4').tobytes())
+    os.replace(path + '.tmp', path)
+
+class MappedFile():
+    '''
+    Read-only memory map of a file written by write_mapped_file. Subclasses set MAGIC and KIND, and read their arrays with array().
+    '''
+    MAGIC = None
+    KIND = 'mapped'
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(self.MAGIC)] != self.MAGIC:
+            self.close()
+            raise ValueError(path + ' is not a ' + self.KIND + ' file.')
+        header_length = struct.unpack_from('<I', self._map, len(self.MAGIC))[0]
+        offset = len(self.MAGIC) + 4
+        self.header = json.loads(self._map[offset:offset + header_length].decode('utf-8'))
+        self._offset = offset + header_length
+
+    def array(self, count):
+        '''
+        Returns a view of the next count uint32 values in the file.
+        '''
+        array = np.frombuffer(self._map, dtype='<u4', count=count, offset=self._offset)
+        self._offset += 4*count
+        return array
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def release(self):
+        '''
+        Drops the arrays that point into the map. Called by close before the map is closed.
+        '''
+        pass
+
+    def close(self):
+        '''
+        Releases the memory map and the file.
+        '''
+        self.release()
+        self._map.close()
+        self._file.close()
+
+def split_index(index):
+    '''
+    Splits an index string such as 'AD:6677 BE:11221010 CF:221111' into its three signatures.
+    '''
+    parts = index.split(' ')
+    if len(parts) != 3 or [part[:3] for part in parts] != ['AD:', 'BE:', 'CF:']:
+        raise KeyError(index)
+    return [part[3:] for part in parts]
+
+def write_catalog(chains_dict, path):
+    '''
+    Writes a chains dictionary (index string -> list of (key tuple, order tuple)) to a catalog file.
+    '''
+    signatures = sorted(set(sig for index in chains_dict for sig in split_index(index)))
+    orders = sorted(set(tuple(order) for candidates in chains_dict.values() for key, order in candidates))
+    if len(signatures) >= 1 << SIGNATURE_BITS or len(orders) >= 1 << ORDER_BITS:
+        raise ValueError('Too many distinct signatures or rotor orders for the catalog format.')
+    signature_ids = {sig: i for i, sig in enumerate(signatures)}
+    order_ids = {order: i for i, order in enumerate(orders)}
+    key_ids = {key: i for i, key in enumerate(KEYS)}
+    entries = []
+    for index, candidates in chains_dict.items():
+        code = 0
+        for sig in split_index(index):
+            code = (code << SIGNATURE_BITS) | signature_ids[sig]
+        records = [(key_ids[''.join(key)] << ORDER_BITS) | order_ids[tuple(order)] for key, order in candidates]
+        entries.append((code, records))
+    entries.sort()
+    codes = np.array([code for code, records in entries], dtype=np.uint32)
+    # starts[i]:starts[i + 1] are the records for codes[i].
+    starts = np.cumsum([0] + [len(records) for code, records in entries]).astype(np.uint32)
+    records = np.array([record for code, records in entries for record in records], dtype=np.uint32)
+    write_mapped_file(path, MAGIC, {'signatures': signatures, 'orders': [list(order) for order in orders],
+                                    'index_count': len(codes), 'record_count': len(records)}, [codes, starts, records])
+
+def convert_pickle(pickle_path='./chains.pickle', catalog_path='./chains.catalog'):
+    '''
+    Converts an existing chains.pickle into a catalog file.
+    '''
+    write_catalog(pickle.load(open(pickle_path, 'rb')), catalog_path)
+
+class ChainCatalog(MappedFile):
+    '''
+    Read-only, memory-mapped view of a catalog file that can be used in place of chains_dict.
+
+    catalog[index] returns the same list of (key tuple, order tuple) that chains_dict[index] does.
+    '''
+    MAGIC = MAGIC
+    KIND = 'chain catalog'
+
+    def __init__(self, path='./chains.catalog'):
+        MappedFile.__init__(self, path)
+        self.signatures = self.header['signatures']
+        self.orders = [tuple(order) for order in self.header['orders']]
+        self._signature_ids = {sig: i for i, sig in enumerate(self.signatures)}
+        count = self.header['index_count']
+        self.codes = self.array(count)
+        self.starts = self.array(count + 1)
+        self.records = self.array(self.header['record_count'])
+
+    def __repr__(self):
+        return 'Chain catalog ' + self.path + ': ' + str(len(self)) + ' indices'
+
+    def release(self):
+        # The arrays point into the map, so drop them before closing it.
+        self.codes = self.starts = self.records = None
+
+    def __len__(self):
+        return len(self.codes)
+
+    def code(self, index):
+        '''
+        Returns the integer code for an index string, or None if one of its signatures never occurs.
+        '''
+        code = 0
+        for sig in split_index(index):
+            if sig not in self._signature_ids:
+                return None
+            code = (code << SIGNATURE_BITS) | self._signature_ids[sig]
+        return code
+
+    def index_string(self, code):
+        '''
+        Turns an integer code back into an index string.
+        '''
+        mask = (1 << SIGNATURE_BITS) - 1
+        ad, be, cf = [self.signatures[(int(code) >> shift) & mask] for shift in (2*SIGNATURE_BITS, SIGNATURE_BITS, 0)]
+        return 'AD:' + ad + ' BE:' + be + ' CF:' + cf
+
+    def position(self, index):
+        '''
+        Returns the position of an index string in the sorted code array, or None if it is not in the catalog (including strings that are not index strings at all, which a chains dictionary would not contain either).
+        '''
+        try:
+            code = self.code(index)
+        except (KeyError, AttributeError):
+            return None
+        if code is None:
+            return None
+        i = int(np.searchsorted(self.codes, code))
+        if i < len(self.codes) and self.codes[i] == code:
+            return i
+        return None
+
+    def candidate_records(self, index):
+        '''
+        Returns the raw uint32 records for an index string (empty if it is not in the catalog).
+        '''
+        i = self.position(index)
+        if i is None:
+            return self.records[:0]
+        return self.records[self.starts[i]:self.starts[i + 1]]
+
+    def decode_record(self, record):
+        '''
+        Turns a record into the (key tuple, order tuple) pair stored in chains_dict.
+        '''
+        record = int(record)
+        return tuple(KEYS[record >> ORDER_BITS]), self.orders[record & ((1 << ORDER_BITS) - 1)]
+
+    def __getitem__(self, index):
+        i = self.position(index)
+        if i is None:
+            raise KeyError(index)
+        return [self.decode_record(record) for record in self.records[self.starts[i]:self.starts[i + 1]]]
+
+    def __contains__(self, index):
+        return self.position(index) is not None
+
+    def get(self, index, default=None):
+        '''
+        Same as dict.get.
+        '''
+        return self[index] if index in self else default
+
+    def keys(self):
+        '''
+        Iterates over the index strings in code order.
+        '''
+        for code in self.codes:
+            yield self.index_string(code)
+
+    def __iter__(self):
+        return self.keys()
+
+    def items(self):
+        '''
+        Iterates over (index string, candidates) pairs in code order.
+        '''
+        for i, code in enumerate(self.codes):
+            yield self.index_string(code), [self.decode_record(record)
+                                            for record in self.records[self.starts[i]:self.starts[i + 1]]]
@@ -0,0 +1,161 @@
+#! /usr/bin/python
+"""
+Module containing a ciphertext-only attack, for when there is neither a doubled message key (rejewski.py, indicators.py) nor a crib (bombe.py).
+
+Outline:
+
+- Sweep every rotor order and every start position with an empty plugboard. Each rotor order is one task for a process pool; the task deciphers the ciphertexts under all 17,576 start positions at once with NumPy and scores every decryption by its index of coincidence (scoring.index_of_coincidence_batch).
+- The plugboard is left out of the sweep, but with the right rotor settings most of the plaintext's letter statistics survive a handful of swaps, so the right setting still scores above almost all of the wrong ones. Only the best top settings are kept, in a bounded heap.
+- Each survivor is then refined with plugsearch.solve_plugboard, and the results are ranked by English fitness.
+
+How much plugboard the sweep can see through depends on the amount of ciphertext. With the three test messages in rejewski.py (about 240 letters) the right setting comes out on top with up to five swaps; with all six it falls to the low thousands, so more traffic or a much larger top is needed.
+
+As in batch.py, ring settings are taken to be A and the reflector is B. Like test_putative_key, every ciphertext is assumed to start from the same rotor position.
+
+The rotor and core tables behind batch.order_tables are module-level (compiled.ROTOR_TABLES, compiled.core_tables), so pool workers started by fork share them with the parent instead of each getting a copy; only the ciphertexts are sent to the workers, once, when they start.
+"""
+# Import helpful tools
+from functools import partial
+from multiprocessing import Pool
+import heapq
+
+import numpy as np
+
+# Import enigma stuff
+from components import ROTOR_WIRINGS, ALPHABET
+from batch import ALL_KEYS, order_tables
+from compiled import CompiledEnigma, normalize_message
+from wheels import REGISTRY
+import instrument
+import plugsearch
+import scoring
+
+def sweep_order(rotor_order, codes_list, top=100, block=256):
+    '''
+    Deciphers the ciphertexts under every start position of one rotor order, with no plugboard, and returns the top best as (IoC, key, rotor order) tuples.
+
+    All 17,576 start positions move forward together one keystroke at a time, and the letters of block keystrokes are counted with a single bincount, so memory stays at block x 17,576 entries however long the ciphertexts are.
+
+    codes_list = list of ciphertexts as letter index arrays (see compiled.normalize_message).
+    '''
+    scrambler, successor = order_tables(rotor_order)
+    # One contiguous column per ciphertext letter, so each keystroke is a one-dimensional take.
+    columns = np.ascontiguousarray(scrambler.T).astype(np.int64)
+    count = len(ALL_KEYS)
+    # Start position n counts its letters in bins n*26 to n*26 + 25.
+    rows = np.arange(count)*26
+    counts = np.zeros(count*26, dtype=np.int64)
+    for codes in codes_list:
+        states = np.arange(count)
+        for start in range(0, len(codes), block):
+            letters = np.empty((min(block, len(codes) - start), count), dtype=np.int64)
+            for i, code in enumerate(codes[start:start + block]):
+                states = successor.take(states)
+                letters[i] = columns[code].take(states)
+            letters += rows
+            counts += np.bincount(letters.ravel(), minlength=count*26)
+    scores = scoring.index_of_coincidence_batch(counts.reshape(count, 26))
+    best = np.argsort(scores)[::-1][:top]
+    return [(float(scores[n]), ''.join(ALPHABET[k] for k in ALL_KEYS[n]), list(rotor_order)) for n in best]
+
+# Set in each worker by _init_worker so the ciphertexts are sent once per process, not once per rotor order.
+_worker_codes = None
+
+def _init_worker(codes_list):
+    global _worker_codes
+    _worker_codes = codes_list
+
+def _sweep_in_worker(rotor_order, top):
+    return sweep_order(rotor_order, _worker_codes, top)
+
+def sweep(ciphertexts, rotors=list(ROTOR_WIRINGS), top=100, workers=None):
+    '''
+    Scores every rotor order and start position by the index of coincidence of the decryption with an empty plugboard.
+
+    ciphertexts = a ciphertext string or a list of them, all sent from the same start position.
+    rotors = the rotors to draw the three-rotor orders from (all of ROTOR_WIRINGS by default, i.e. 336 orders).
+    top = number of settings to keep.
+    workers = number of processes (defaults to the number of CPUs, 1 runs everything in this process).
+
+    Returns a list of (IoC, key, rotor order), best first.
+    '''
+    if isinstance(ciphertexts, str):
+        ciphertexts = [ciphertexts]
+    codes_list = [np.frombuffer(normalize_message(ciphertext), dtype=np.uint8) for ciphertext in ciphertexts]
+    orders = REGISTRY.wheel_orders(3, rotors)
+    # Bounded min-heap: the worst survivor sits at the front and is pushed out by anything better.
+    heap = []
+    with instrument.timer('ciphertext_only.sweep'):
+        if workers == 1:
+            results = (sweep_order(order, codes_list, top) for order in orders)
+            pool = None
+        else:
+            pool = Pool(workers, initializer=_init_worker, initargs=(codes_list,))
+            results = pool.imap_unordered(partial(_sweep_in_worker, top=top), orders)
+        try:
+            for survivors in results:
+                if instrument.enabled:
+                    instrument.count('candidates.tested', len(ALL_KEYS))
+                for score, key, order in survivors:
+                    entry = (score, key, order)
+                    if len(heap) < top:
+                        heapq.heappush(heap, entry)
+                    elif entry > heap[0]:
+                        heapq.heapreplace(heap, entry)
+        finally:
+            if pool is not None:
+                pool.terminate()
+    return sorted(heap, reverse=True)
+
+def _refine_task(survivor, ciphertexts, restarts, max_plugs, seed):
+    ioc, key, order = survivor
+    plugboard, fitness = plugsearch.solve_plugboard(ciphertexts, key, order, restarts, workers=1, max_plugs=max_plugs,
+                                                    seed=seed)
+    return fitness, ioc, key, order, plugboard
+
+def refine(survivors, ciphertexts, restarts=4, max_plugs=6, workers=None, seed=0):
+    '''
+    Runs a plugboard hill climb (plugsearch.solve_plugboard) for each (IoC, key, rotor order) survivor of sweep.
+
+    Returns a list of (fitness, IoC, key, rotor order, Plugboard), best fitness first.
+    '''
+    if isinstance(ciphertexts, str):
+        ciphertexts = [ciphertexts]
+    task = partial(_refine_task, ciphertexts=ciphertexts, restarts=restarts, max_plugs=max_plugs, seed=seed)
+    with instrument.timer('ciphertext_only.refine'):
+        if workers == 1:
+            results = [task(survivor) for survivor in survivors]
+        else:
+            with Pool(workers) as pool:
+                results = pool.map(task, survivors)
+    results.sort(key=lambda result: result[0], reverse=True)
+    return results
+
+def ciphertext_only_search(ciphertexts, rotors=list(ROTOR_WIRINGS), top=100, refine_top=20, restarts=4, max_plugs=6,
+                           workers=None, seed=0):
+    '''
+    Recovers rotor order, start position and plugboard from ciphertext alone.
+
+    ciphertexts = a ciphertext string or a list of them, all sent from the same start position.
+    rotors = the rotors to draw the rotor orders from.
+    top = settings kept by the index of coincidence sweep.
+    refine_top = how many of those get a plugboard search.
+    restarts, max_plugs = passed on to plugsearch.solve_plugboard.
+    workers = number of processes (defaults to the number of CPUs, 1 runs everything in this process).
+
+    Returns a list of (fitness, key, rotor order, swaps, plaintexts), best first. The fitness is the mean English log probability per letter (about -2.9 for English text).
+    '''
+    if isinstance(ciphertexts, str):
+        ciphertexts = [ciphertexts]
+    survivors = sweep(ciphertexts, rotors, top, workers)
+    ranked = []
+    for fitness, ioc, key, order, plugboard in refine(survivors[:refine_top], ciphertexts, restarts, max_plugs, workers,
+                                                      seed):
+        engine = CompiledEnigma(key, plugboard.swaps, order)
+        plaintexts = []
+        for ciphertext in ciphertexts:
+            engine.set_rotor_position(key)
+            plaintexts.append(engine.decipher(ciphertext))
+        swaps = sorted(a + b for a, b in plugboard.swaps.items() if a < b)
+        ranked.append((fitness, key, order, swaps, plaintexts))
+    return ranked
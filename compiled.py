@@ -0,0 +1,474 @@
+#!/usr/bin/python
+
+'''
+Enigma Machine Simulation
+
+Details: This file holds a compiled version of the Enigma machine. Rather than walking the linked Rotor objects from components.py for every keystroke, a machine setting (rotor order, window key and plugboard) is turned into integer lookup tables once and every letter is then enciphered with three table lookups. The output is identical to machine.Enigma.encipher.
+
+How the tables fit together: the left (fast) rotor plus the plugboard make up the "entry" and "exit" tables, which depend on the setting. The middle rotor, right rotor and reflector only move once every 26 letters, so the path through them is folded into a single "core" table per middle/right position. Core tables do not depend on the plugboard or the left rotor, so they are built once per middle/right rotor pair and shared by every compiled machine.
+'''
+# Module imports.
+import copy
+import re
+import threading
+from collections import namedtuple, OrderedDict
+from multiprocessing import Pool
+
+from components import ALPHABET
+import instrument
+from wheels import REGISTRY
+
+# Characters accepted by Enigma.encipher. Compiled once here rather than on every call.
+INVALID_CHARS = re.compile(r'[^a-zA-Z ]')
+
+# Maps the ASCII codes of 'A'-'Z' onto 0-25 so a whole message can be converted in one pass.
+LETTER_CODES = bytes.maketrans(ALPHABET.encode('ascii'), bytes(range(26)))
+
+# Maps both 'a'-'z' and 'A'-'Z' onto 0-25 and every other byte onto INVALID_CODE, so a raw buffer is case-folded, converted and checked in a single translate.
+INVALID_CODE = 255
+BUFFER_CODES = bytes(ALPHABET.index(chr(b).upper()) if chr(b).isalpha() and b < 128 else INVALID_CODE for b in range(256))
+
+# Every byte value other than 'A'-'Z', so non-letters can be deleted from a chunk in one pass.
+NON_LETTERS = bytes(b for b in range(256) if not 65 <= b <= 90)
+LETTER_RUNS = re.compile(rb'[A-Z]+')
+INVALID_BYTES = re.compile(rb'[^A-Z\s]')
+
+# What encipher_chunk does with characters that are not letters.
+NON_LETTER_POLICIES = ['drop', 'pass', 'error']
+
+# Rotor tables are computed once by the wheel registry and shared by every compiled machine.
+# ROTOR_TABLES[rotor] = (forward, backward), where forward[shift][index] is the output index for an input index, using the same window-relative indexing as components.Rotor.encode_letter. The shift is the window offset less the ring setting.
+ROTOR_TABLES = {rotor_num: (wheel.shifted_forward, wheel.shifted_backward) for rotor_num, wheel in REGISTRY.rotors.items()}
+REFLECTOR_TABLE = REGISTRY.reflector_table('B')
+
+# Core tables (middle rotor -> right rotor -> reflector -> back), keyed by rotors and reflector, most recently used last.
+# They are built for ring setting A; other ring settings only change which table goes with which window position.
+# Each entry is about 0.2 MB, and a Greek wheel position makes a different reflector, so only CORE_TABLE_CAPACITY are kept. Machines keep the tables they were built with after an entry is dropped.
+CORE_TABLE_CAPACITY = 64
+_CORE_TABLES = OrderedDict()
+_CORE_TABLES_LOCK = threading.Lock()
+
+def core_tables(m_rotor_num, r_rotor_num, m_ring=0, r_ring=0, reflector=REFLECTOR_TABLE):
+    '''
+    Returns the 676 core tables for a middle/right rotor pair, building them the first time the combination is seen.
+    The table for middle offset m and right offset r is found at index m*26 + r.
+
+    m_ring, r_ring = ring setting offsets of the two rotors.
+    reflector = reflector table (26 output indices), with any Greek wheel already folded in (see WheelRegistry.reflector_table).
+    '''
+    pair = (m_rotor_num, r_rotor_num, tuple(reflector))
+    with _CORE_TABLES_LOCK:
+        tables = _CORE_TABLES.get(pair)
+        if tables is not None:
+            _CORE_TABLES.move_to_end(pair)
+    if tables is None:
+        m_forward, m_backward = ROTOR_TABLES[m_rotor_num]
+        r_forward, r_backward = ROTOR_TABLES[r_rotor_num]
+        tables = []
+        for m in range(26):
+            for r in range(26):
+                tables.append([m_backward[m][r_backward[r][reflector[r_forward[r][m_forward[m][i]]]]] for i in range(26)])
+        with _CORE_TABLES_LOCK:
+            tables = _CORE_TABLES.setdefault(pair, tables)
+            _CORE_TABLES.move_to_end(pair)
+            while len(_CORE_TABLES) > CORE_TABLE_CAPACITY:
+                _CORE_TABLES.popitem(last=False)
+    if m_ring == 0 and r_ring == 0:
+        return tables
+    # The wiring sits at the window offset less the ring offset, so a ring setting just renumbers the shared tables.
+    return [tables[((m - m_ring)%26)*26 + (r - r_ring)%26] for m in range(26) for r in range(26)]
+
+def advance_offsets(offsets, notches, steps):
+    '''
+    Returns the [left, middle, right] rotor offsets after steps keystrokes, without replaying them.
+
+    The left rotor moves on every keystroke and carries into the middle rotor each time it steps off its notch, and the middle rotor carries into the right rotor the same way (see Rotor.step). If the left rotor is a steps away from its notch, the middle rotor therefore moves on keystrokes a+1, a+27, a+53, ... and the number of moves can be counted directly.
+
+    offsets = current [left, middle, right] offsets.
+    notches = [left, middle] lists of notch offsets (rotors VI - VIII have two notches).
+    '''
+    l, m, r = offsets
+    l_steps, m_steps, r_steps = step_counts(offsets, notches, steps)
+    return [(l + l_steps)%26, (m + m_steps)%26, (r + r_steps)%26]
+
+def carries(offset, notches, steps):
+    '''
+    Returns how many times a rotor starting at offset steps off one of its notches, and so carries into the next rotor, during its next steps moves.
+    '''
+    return sum((steps + 25 - (notch - offset)%26)//26 for notch in notches)
+
+def step_counts(offsets, notches, steps):
+    '''
+    Returns how many times the [left, middle, right] rotors move during the next steps keystrokes (see advance_offsets).
+    '''
+    l, m, r = offsets
+    m_steps = carries(l, notches[0], steps)
+    r_steps = carries(m, notches[1], m_steps)
+    return [steps, m_steps, r_steps]
+
+def record_steps(rotor_order, offsets, notches, steps):
+    '''
+    Adds the letters, rotor steps and notch turnovers of steps keystrokes to the instrument counters, using the same names as the letter by letter machine.
+    '''
+    counts = step_counts(offsets, notches, steps)
+    instrument.count('letters', steps)
+    for i, rotor_num in enumerate(rotor_order[:3]):
+        instrument.count('rotor.' + rotor_num + '.steps', counts[i])
+        # A rotor turns over each time it carries into the next one.
+        if i < 2:
+            instrument.count('rotor.' + rotor_num + '.turnovers', counts[i + 1])
+
+def rotor_position_after(key, rotor_order, steps):
+    '''
+    Returns the window setting a machine starting at key shows after steps keystrokes. A Greek wheel letter, if any, does not change.
+    '''
+    notches = [REGISTRY.rotors[rotor_num].notches for rotor_num in rotor_order[:2]]
+    offsets = advance_offsets([ALPHABET.index(letter) for letter in key[:3].upper()], notches, steps)
+    return ''.join(ALPHABET[offset] for offset in offsets) + key[3:].upper()
+
+class CompiledEnigma():
+    '''
+    This class holds the lookup tables for one Enigma setting.
+
+    It takes the same arguments as machine.Enigma. Like the real machine it is stateful: the rotor offsets advance as letters are enciphered, and set_rotor_position resets them.
+    '''
+
+    def __init__(self, key='AAA', swaps=None, rotor_order=['I', 'II', 'III'], rings=None, reflector=None):
+        '''
+        Builds the tables for a setting.
+
+        key = Three letter window setting for the left, middle and right rotors, plus a fourth letter for a Greek wheel.
+
+        swaps = Plugboard swaps of the form [('A', 'B'), ('T', 'G')], or an already built swap dictionary such as Plugboard.swaps.
+
+        rotor_order = Rotors to use as left, middle and right rotors, optionally followed by a Greek wheel.
+
+        rings = Ring settings, one letter per rotor (defaults to those in wheels.json).
+
+        reflector = Reflector name (defaults to B, or B-thin with a Greek wheel).
+        '''
+        self.rotor_order = list(rotor_order)
+        wheels = [REGISTRY.wheel(rotor_num) for rotor_num in self.rotor_order]
+        self.rings = [wheel.ring for wheel in wheels] if rings is None else [ALPHABET.index(letter) for letter in rings.upper()]
+        self.reflector = reflector or REGISTRY.default_reflector(self.rotor_order)
+        # Swaps are upper-cased, as Plugboard does, so every engine treats 'ab' like 'AB'.
+        if isinstance(swaps, dict):
+            self.swaps = {a.upper(): b.upper() for a, b in swaps.items()}
+        else:
+            self.swaps = {}
+            if swaps != None and len(swaps) > 0:
+                for swap in swaps:
+                    self.swaps[swap[0].upper()] = swap[1].upper()
+                    self.swaps[swap[1].upper()] = swap[0].upper()
+        if instrument.enabled:
+            instrument.count('compiled.builds')
+        self.notches = [wheel.notches for wheel in wheels[:2]]
+        # turnovers[rotor][offset] is True if the left (0) or middle (1) rotor carries when it steps from that offset.
+        self.turnovers = [[offset in notches for offset in range(26)] for notches in self.notches]
+        # The plugboard is applied to the uppercase letter on the way in and returned as is on the way out, as in Enigma.encode_decode_letter.
+        plug_in = [ALPHABET.index(self.swaps.get(letter, letter).upper()) for letter in ALPHABET]
+        plug_out = [ord(self.swaps.get(letter, letter)) for letter in ALPHABET]
+        # Fold the plugboard and the ring setting into the left rotor.
+        l_forward, l_backward = ROTOR_TABLES[self.rotor_order[0]]
+        l_ring = self.rings[0]
+        self.entry = [[l_forward[(l - l_ring)%26][plug_in[i]] for i in range(26)] for l in range(26)]
+        self.exit = [[plug_out[l_backward[(l - l_ring)%26][i]] for i in range(26)] for l in range(26)]
+        self.greek_offset = ALPHABET.index(key[3].upper()) if len(self.rotor_order) == 4 else None
+        self.cores = self.build_cores()
+        self.set_rotor_position(key)
+
+    def build_cores(self):
+        '''
+        Returns the shared core tables for this machine's middle and right rotors, ring settings, reflector and Greek wheel position.
+        '''
+        greek = self.rotor_order[3] if len(self.rotor_order) == 4 else None
+        shift = self.greek_offset - self.rings[3] if greek else 0
+        reflector = REGISTRY.reflector_table(self.reflector, greek, shift)
+        return core_tables(self.rotor_order[1], self.rotor_order[2], self.rings[1], self.rings[2], reflector)
+
+    def __repr__(self):
+        return 'Compiled Enigma ' + str(self.rotor_order) + ', window: ' + self.window()
+
+    def copy(self):
+        '''
+        Returns a machine with its own rotor offsets that shares this machine's (read-only) tables.
+        '''
+        machine = copy.copy(self)
+        machine.offsets = list(self.offsets)
+        return machine
+
+    def window(self):
+        '''
+        Returns the letters currently visible in the windows.
+        '''
+        greek = '' if self.greek_offset is None else ALPHABET[self.greek_offset]
+        return ''.join(ALPHABET[offset] for offset in self.offsets) + greek
+
+    def set_rotor_position(self, position_key):
+        '''
+        Resets the rotors to a three letter window setting such as 'AAA'. On a four-rotor machine a fourth letter also turns the Greek wheel.
+        '''
+        offsets = [ALPHABET.index(letter) for letter in position_key.upper()]
+        self.offsets = offsets[:3]
+        if len(offsets) == 4 and offsets[3] != self.greek_offset:
+            self.greek_offset = offsets[3]
+            self.cores = self.build_cores()
+
+    def advance(self, steps):
+        '''
+        Moves the rotors forward by steps keystrokes in constant time.
+        '''
+        self.offsets = advance_offsets(self.offsets, self.notches, steps)
+
+    def encipher(self, message):
+        '''
+        Given a message string, encode or decode that message. Matches Enigma.encipher.
+        '''
+        codes = normalize_message(message)
+        if codes is None:
+            return 'Please provide a string containing only the characters a-zA-Z and spaces.'
+        return self.encipher_codes(codes).decode('ascii')
+
+    def decipher(self, message):
+        '''
+        Encryption == decryption.
+        '''
+        return self.encipher(message)
+
+    def encipher_chunk(self, chunk, non_letters='drop'):
+        '''
+        Enciphers one chunk of a longer stream. The rotor offsets carry over to the next call, so a message split into chunks comes out the same as the whole message.
+
+        chunk = bytes-like object or str. Lowercase letters are treated as uppercase.
+
+        non_letters = 'drop' removes everything that is not a letter, 'pass' copies non-letters to the output unchanged, and 'error' drops whitespace but raises ValueError on anything else.
+
+        Returns bytes, or str if chunk was a str.
+        '''
+        if non_letters not in NON_LETTER_POLICIES:
+            raise ValueError('non_letters must be one of ' + ', '.join(NON_LETTER_POLICIES) + '.')
+        data = chunk.encode('utf-8') if isinstance(chunk, str) else bytes(chunk)
+        data = data.upper()
+        letters = data.translate(None, NON_LETTERS)
+        if non_letters == 'error' and len(letters) != len(data):
+            invalid = INVALID_BYTES.search(data)
+            if invalid:
+                raise ValueError('Invalid character ' + repr(invalid.group()) + ' at offset ' + str(invalid.start()) + ' of chunk.')
+        cipher = self.encipher_codes(letters.translate(LETTER_CODES))
+        if non_letters == 'pass' and len(letters) != len(data):
+            # Put the enciphered letters back between the non-letters.
+            output = bytearray(data)
+            position = 0
+            for run in LETTER_RUNS.finditer(data):
+                length = run.end() - run.start()
+                output[run.start():run.end()] = cipher[position:position + length]
+                position += length
+            cipher = output
+        return cipher.decode('utf-8') if isinstance(chunk, str) else bytes(cipher)
+
+    def encipher_into(self, data, out):
+        '''
+        Enciphers a buffer of ASCII text into a caller-supplied buffer.
+
+        data = any object supporting the buffer protocol (bytes, bytearray, memoryview, mmap, ...). As with encipher, letters may be either case and spaces are skipped; any other byte raises ValueError.
+        out = writable buffer (bytearray, memoryview, ...) with room for the enciphered letters.
+
+        Returns the number of letters written to out.
+        '''
+        if not isinstance(data, (bytes, bytearray)):
+            # translate is only defined on bytes and bytearray, so other buffers get one flat memcpy first.
+            data = memoryview(data).cast('B').tobytes()
+        codes = data.translate(BUFFER_CODES, b' ')
+        if INVALID_CODE in codes:
+            raise ValueError('Please provide a buffer containing only the characters a-zA-Z and spaces.')
+        target = memoryview(out)
+        if len(target) < len(codes):
+            raise ValueError('The output buffer holds ' + str(len(target)) + ' bytes but ' + str(len(codes)) + ' are needed.')
+        self.encipher_codes(codes, target)
+        return len(codes)
+
+    def encipher_codes(self, codes, out=None):
+        '''
+        Enciphers a sequence of letter indices (0-25), such as bytes, and returns the ASCII output as a bytearray.
+        If a writable buffer out is given, the output is written there instead and out is returned.
+        The rotors step exactly as Rotor.step does: the left rotor moves on every letter and carries into the middle rotor when it leaves its notch, which in turn carries into the right rotor.
+        '''
+        entry = self.entry
+        exit = self.exit
+        cores = self.cores
+        l_turnover, m_turnover = self.turnovers
+        l, m, r = self.offsets
+        core = cores[m*26 + r]
+        output = bytearray(len(codes)) if out is None else out
+        if instrument.enabled:
+            record_steps(self.rotor_order, self.offsets, self.notches, len(codes))
+        for i, code in enumerate(codes):
+            if l_turnover[l]:
+                if m_turnover[m]:
+                    r = (r + 1)%26
+                m = (m + 1)%26
+                core = cores[m*26 + r]
+            l = (l + 1)%26
+            output[i] = exit[l][core[entry[l][code]]]
+        self.offsets = [l, m, r]
+        return output
+
+def normalize_message(message):
+    '''
+    Validates and normalizes a message the way Enigma.encipher does and returns it as letter indices (bytes), or None if it contains characters other than a-zA-Z and spaces.
+    '''
+    if INVALID_CHARS.search(message):
+        return None
+    return message.upper().replace(' ', '').strip().encode('ascii').translate(LETTER_CODES)
+
+def encipher_at(message, position, key='AAA', swaps=None, rotor_order=['I', 'II', 'III'], rings=None, reflector=None):
+    '''
+    Enciphers message as if it started position letters into a message sent with the given setting.
+
+    Because encryption == decryption, this also deciphers any slice of a ciphertext without replaying the letters before it: encipher_at(cipher[100:200], 100, ...) gives plaintext letters 100 to 199.
+    '''
+    codes = normalize_message(message)
+    if codes is None:
+        return 'Please provide a string containing only the characters a-zA-Z and spaces.'
+    engine = CompiledEnigma(key, swaps, rotor_order, rings, reflector)
+    engine.advance(position)
+    return engine.encipher_codes(codes).decode('ascii')
+
+def decipher_at(message, position, key='AAA', swaps=None, rotor_order=['I', 'II', 'III'], rings=None, reflector=None):
+    '''
+    Encryption == decryption.
+    '''
+    return encipher_at(message, position, key, swaps, rotor_order, rings, reflector)
+
+def _encipher_part(task):
+    '''
+    Worker task for encipher_parallel: enciphers one chunk of letter indices starting at its offset.
+    '''
+    key, swaps, rotor_order, rings, reflector, position, codes = task
+    engine = CompiledEnigma(key, swaps, rotor_order, rings, reflector)
+    engine.advance(position)
+    return bytes(engine.encipher_codes(codes))
+
+def encipher_parallel(message, key='AAA', swaps=None, rotor_order=['I', 'II', 'III'], workers=None, chunk_size=1 << 20, rings=None,
+                      reflector=None):
+    '''
+    Enciphers a long message across a process pool. The message is cut into chunks of chunk_size letters, each worker moves its own machine straight to the chunk's offset, and the pieces are joined. Output matches Enigma(key, swaps, rotor_order, rings=rings, reflector=reflector).encipher(message).
+
+    workers = number of processes (defaults to the number of CPUs).
+    '''
+    codes = normalize_message(message)
+    if codes is None:
+        return 'Please provide a string containing only the characters a-zA-Z and spaces.'
+    tasks = [(key, swaps, rotor_order, rings, reflector, start, codes[start:start + chunk_size])
+             for start in range(0, len(codes), chunk_size)]
+    # Not worth starting processes for a single chunk.
+    if len(tasks) <= 1 or workers == 1:
+        return b''.join(map(_encipher_part, tasks)).decode('ascii')
+    with Pool(workers) as pool:
+        return b''.join(pool.map(_encipher_part, tasks)).decode('ascii')
+
+# An immutable, hashable machine setting. Build it with make_settings so equal settings compare equal.
+# swaps holds the plugboard as a sorted tuple of (letter, partner) entries, both directions included.
+# rings and reflector are always filled in, so leaving them out and giving the defaults make the same setting.
+MachineSettings = namedtuple('MachineSettings', ['rotor_order', 'key', 'swaps', 'rings', 'reflector'])
+
+def make_settings(key='AAA', swaps=None, rotor_order=['I', 'II', 'III'], rings=None, reflector=None):
+    '''
+    Builds a MachineSettings from the same arguments as machine.Enigma. swaps may also be a Plugboard.swaps dictionary.
+    '''
+    if rings is None:
+        rings = ''.join(ALPHABET[REGISTRY.wheel(rotor_num).ring] for rotor_num in rotor_order)
+    reflector = reflector or REGISTRY.default_reflector(rotor_order)
+    if isinstance(swaps, dict):
+        swaps = {a.upper(): b.upper() for a, b in swaps.items()}
+    else:
+        pairs = swaps
+        swaps = {}
+        if pairs != None and len(pairs) > 0:
+            for swap in pairs:
+                swaps[swap[0].upper()] = swap[1].upper()
+                swaps[swap[1].upper()] = swap[0].upper()
+    return MachineSettings(tuple(rotor_order), key.upper(), tuple(sorted(swaps.items())), rings.upper(), reflector)
+
+class SettingsCache():
+    '''
+    Bounded, thread-safe LRU cache from MachineSettings to compiled machines.
+
+    The tables do not depend on the window key, so entries are keyed by everything else (rotor order, plugboard, ring settings and reflector) and settings that differ only in their key share one entry. get() returns a fresh CompiledEnigma set to the settings' window key. Machines handed out share the cached tables but have their own rotor offsets, so callers can use them concurrently.
+    '''
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._machines = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'SettingsCache: ' + str(self.stats())
+
+    def __len__(self):
+        return len(self._machines)
+
+    def get(self, settings):
+        '''
+        Returns a CompiledEnigma for a MachineSettings, building and caching it on a miss.
+        '''
+        tables = settings._replace(key='')
+        with self._lock:
+            machine = self._machines.get(tables)
+            if machine is not None:
+                self._machines.move_to_end(tables)
+                self.hits += 1
+                return self._at_key(machine, settings.key)
+            self.misses += 1
+        # Build outside the lock so other threads are not held up by a miss.
+        machine = CompiledEnigma(settings.key, dict(settings.swaps), settings.rotor_order, settings.rings, settings.reflector)
+        with self._lock:
+            machine = self._machines.setdefault(tables, machine)
+            self._machines.move_to_end(tables)
+            while len(self._machines) > self.capacity:
+                self._machines.popitem(last=False)
+        return self._at_key(machine, settings.key)
+
+    def _at_key(self, machine, key):
+        # A Greek wheel letter other than the cached machine's makes the copy pick up its own core tables.
+        machine = machine.copy()
+        machine.set_rotor_position(key)
+        return machine
+
+    def machine(self, key='AAA', swaps=None, rotor_order=['I', 'II', 'III'], rings=None, reflector=None):
+        '''
+        Same as get(make_settings(key, swaps, rotor_order, rings, reflector)).
+        '''
+        return self.get(make_settings(key, swaps, rotor_order, rings, reflector))
+
+    def stats(self):
+        '''
+        Returns a dictionary of hits, misses, current size and capacity.
+        '''
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._machines), 'capacity': self.capacity}
+
+    def clear(self):
+        '''
+        Empties the cache and resets the counters.
+        '''
+        with self._lock:
+            self._machines.clear()
+            self.hits = 0
+            self.misses = 0
+
+# Cache used by compile_machine, and so by Enigma(compiled=True).
+SETTINGS_CACHE = SettingsCache()
+
+def compile_machine(enigma, cache=SETTINGS_CACHE):
+    '''
+    Returns a CompiledEnigma for the current state of a machine.Enigma (rotors, windows, ring settings, reflector and plugboard), taken from cache when the setting has been seen before.
+    '''
+    rotors = [enigma.l_rotor, enigma.m_rotor, enigma.r_rotor]
+    if enigma.greek_rotor:
+        rotors.append(enigma.greek_rotor)
+    return cache.get(make_settings(''.join(rotor.window for rotor in rotors), enigma.plugboard.swaps,
+                                   [rotor.rotor_num for rotor in rotors], ''.join(ALPHABET[rotor.ring] for rotor in rotors),
+                                   enigma.reflector.name))
@@ -8,27 +8,22 @@ Date: April 6, 2018
 Details: This file holds the components of the Engima machine. The machine.py file contains the code that will actually run the machine.
 '''
 
+import instrument
+from wheels import REGISTRY
+
 # Define global variables to hold rotor wiring and stepping information.
-# Wiring information is derived from users.telenet.be/d.rijmenants/en/enigmatech.htm#wiringtables.
-
-ROTOR_WIRINGS = {
-    'I': {'forward':'EKMFLGDQVZNTOWYHXUSPAIBRCJ',
-          'backward':'UWYGADFPVZBECKMTHXSLRINQOJ'},
-    'II':{'forward':'AJDKSIRUXBLHWTMCQGZNPYFVOE',
-          'backward':'AJPCZWRLFBDKOTYUQGENHXMIVS'},
-    'III':{'forward':'BDFHJLCPRTXVZNYEIWGAKMUSQO',
-           'backward':'TAGBPCSDQEUFVNZHYIXJWLRKOM'},
-    'V':{'forward':'VZBRGITYUPSDNHLXAWMJQOFECK',
-           'backward':'QCYLXWENFTZOSMVJUDKGIARPHB'}
-}
-
-# The next left rotor will step when the specified letters are visible in the window for that rotor.
-ROTOR_NOTCHES = {
-    'I':'Q', # Next rotor steps when I moves from Q -> R
-    'II':'E', # Next rotor steps when II moves from E -> F
-    'III':'V', # Next rotor steps when III moves from V -> W
-    'V':'Z' # Next rotor steps when V moves from Z -> A
-    }
+# Wiring information is derived from users.telenet.be/d.rijmenants/en/enigmatech.htm#wiringtables and lives in wheels.json.
+
+ROTOR_WIRINGS = {rotor_num: {'forward': wheel.wiring, 'backward': wheel.inverse_wiring}
+                 for rotor_num, wheel in REGISTRY.rotors.items()}
+
+# Greek wheels for the four-rotor machine. They sit next to the reflector and never step.
+GREEK_WIRINGS = {name: {'forward': wheel.wiring, 'backward': wheel.inverse_wiring}
+                 for name, wheel in REGISTRY.greek.items()}
+
+# The next left rotor will step when one of the specified letters is visible in the window for that rotor.
+# For example, the next rotor steps when I moves from Q -> R, and when VI moves from Z -> A or from M -> N.
+ROTOR_NOTCHES = {rotor_num: wheel.notch for rotor_num, wheel in REGISTRY.rotors.items()}
 
 # Define alphabet global variable in order to do proper index matching between rotors.
 ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
@@ -37,19 +32,25 @@ class Rotor:
     '''
     This class defines the rotors for the Engima machine.
     '''
-    def __init__(self, rotor_num, window_letter, next_rotor=None, prev_rotor=None):
-        if rotor_num == 'I' or rotor_num == 'II' or rotor_num == 'III' or rotor_num == 'V':
+    def __init__(self, rotor_num, window_letter, next_rotor=None, prev_rotor=None, ring_letter=None):
+        if rotor_num in ROTOR_WIRINGS or rotor_num in GREEK_WIRINGS:
+            wheel = REGISTRY.wheel(rotor_num)
             self.rotor_num = rotor_num
-            self.wiring = ROTOR_WIRINGS[rotor_num]
-            self.notch = ROTOR_NOTCHES[rotor_num]
+            self.wiring = ROTOR_WIRINGS.get(rotor_num) or GREEK_WIRINGS[rotor_num]
+            # Integer wiring tables, shared with every other rotor of the same kind.
+            self.forward = wheel.forward
+            self.backward = wheel.backward
+            self.notch = wheel.notch
             # This is the letter visible to the operator.
             # Defining this is akin to defining the initial setting of the machine.
             self.window = window_letter.upper()
             self.offset = ALPHABET.index(self.window)
+            # The ring setting turns the wiring against the letters on the ring.
+            self.ring = wheel.ring if ring_letter is None else ALPHABET.index(ring_letter.upper())
             self.next_rotor = next_rotor
             self.prev_rotor = prev_rotor
         else:
-            print('Please select I, II, III, or V for your rotor number and provide the initial window setting (i.e. the letter on the wheel initially visible to the operator.')
+            print('Please select one of ' + ', '.join(list(ROTOR_WIRINGS) + list(GREEK_WIRINGS)) + ' for your rotor number and provide the initial window setting (i.e. the letter on the wheel initially visible to the operator.')
             return None
 
     def __repr__(self):
@@ -63,8 +64,12 @@ class Rotor:
         If a next rotor is specified, do the check to see if we've reached the notch,
         thus requiring that rotor to step.
         """
-        if self.next_rotor and self.window==self.notch:
+        if self.next_rotor and self.window in self.notch:
+            if instrument.enabled:
+                instrument.count('rotor.' + self.rotor_num + '.turnovers')
             self.next_rotor.step()
+        if instrument.enabled:
+            instrument.count('rotor.' + self.rotor_num + '.steps')
         self.offset = (self.offset + 1)%26
         self.window = ALPHABET[self.offset]
        # print(self.offset, self.window)
@@ -84,17 +89,22 @@ class Rotor:
         # Make sure it's number and not a letter.
         if type(index)==str and len(index) == 1:
             index = ALPHABET.index(index.upper())
-        if forward:
-            key = 'forward'
-        else:
-            key = 'backward'
-        # Check the wiring table and find the associated letter with this index.
-        output_letter = self.wiring[key][(index + self.offset)%26]
+        table = self.forward if forward else self.backward
+        # The wiring is turned by the window offset less the ring setting.
+        shift = self.offset - self.ring
+        # Check the wiring table and find the associated output with this index.
+        output = table[(index + shift)%26]
         # Determine output index associated with this letter based on wiring.
-        output_index = (ALPHABET.index(output_letter) - self.offset)%26
+        output_index = (output - shift)%26
         if printit:
-            print('Rotor ' + self.rotor_num + ': input = ' +
-                  ALPHABET[(self.offset + index)%26] + ', output = ' + output_letter)
+            output_letter = ALPHABET[output]
+            # With instrumentation on, the trace goes to the sinks instead of the screen.
+            if instrument.enabled:
+                instrument.event('rotor.trace', rotor=self.rotor_num, input=ALPHABET[(self.offset + index)%26],
+                                 output=output_letter)
+            else:
+                print('Rotor ' + self.rotor_num + ': input = ' +
+                      ALPHABET[(self.offset + index)%26] + ', output = ' + output_letter)
         if self.next_rotor and forward:
             return self.next_rotor.encode_letter(output_index, forward)
         elif self.prev_rotor and not forward:
@@ -117,13 +127,11 @@ class Reflector:
     '''
     This class defines the reflector for the Engima machine.
     '''
-    def __init__(self):
-        # Note: this is the wiring for Reflector B of the Wehrmaht Engima.
-        self.wiring = {'A':'Y', 'B':'R', 'C':'U', 'D':'H', 'E':'Q', 'F':'S', 'G':'L', 'H':'D',
-                       'I':'P', 'J':'X', 'K':'N', 'L':'G', 'M':'O', 'N':'K', 'O':'M', 'P':'I',
-                       'Q':'E', 'R':'B', 'S':'F', 'T':'Z', 'U': 'C', 'V':'W', 'W':'V', 'X':'J',
-                       'Y':'A', 'Z':'T'
-                      }
+    def __init__(self, reflector='B'):
+        # Reflector B of the Wehrmacht Enigma unless another one from wheels.json is chosen.
+        self.name = reflector
+        wiring = REGISTRY.reflectors[reflector].wiring
+        self.wiring = {letter: wiring[i] for i, letter in enumerate(ALPHABET)}
     def __repr__(self):
         print('Reflector wiring: ')
         print(self.wiring)
@@ -141,8 +149,9 @@ class Plugboard():
         self.swaps = {}
         if swaps != None and len(swaps) > 0:
             for swap in swaps:
-                self.swaps[swap[0]] = swap[1]
-                self.swaps[swap[1]] = swap[0]
+                # Letters are enciphered in upper case, so the swaps are too.
+                self.swaps[swap[0].upper()] = swap[1].upper()
+                self.swaps[swap[1].upper()] = swap[0].upper()
 
     def __repr__(self):
         print('Swaps:')
@@ -168,6 +177,6 @@ class Plugboard():
                 print('Only a maximum of 6 swaps is allowed.')
             else:
                 for swap in new_swaps:
-                    self.swaps[swap[0]] = swap[1]
-                    self.swaps[swap[1]] = swap[0]
+                    self.swaps[swap[0].upper()] = swap[1].upper()
+                    self.swaps[swap[1].upper()] = swap[0].upper()
         return
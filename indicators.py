@@ -0,0 +1,296 @@
+#! /usr/bin/python
+"""
+Module containing an incremental version of the first steps of Rejewski's attack.
+
+rejewski.generate_permutation_dicts needs the whole day's list of six-letter indicators before anything can be looked up. IndicatorCollector instead takes indicators one at a time (or from a stream), keeps the AD, BE and CF permutations as 26-byte arrays, and after every indicator works out which catalog entries are still possible:
+
+- every cycle already closed in the partial permutation must appear in the catalog signature,
+- the open fragments (chains whose ends are not known yet, including letters not seen at all) must fit into the remaining cycles.
+
+So the number of candidate (key, order) pairs can be watched shrinking as traffic arrives, instead of waiting for all 26 letters of each permutation.
+
+CatalogQuery does the lookups. It can also be used on its own with partially filled AD, BE and CF dictionaries, which make_chains_from_permutation_dict and generate_chain_index cannot handle.
+"""
+# Import helpful tools
+import numpy as np
+
+import catalog as cat
+
+ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+UNKNOWN = 255
+
+def parse_signature(signature):
+    '''
+    Returns every way of reading a signature string such as '11221010' as sorted cycle lengths adding up to 26, e.g. [[1, 1, 2, 2, 10, 10]].
+    The lengths are written without separators, so a string could in principle be read more than one way.
+    '''
+    readings = []
+    def read(rest, lengths):
+        if not rest:
+            if sum(lengths) == 26:
+                readings.append(lengths)
+            return
+        for width in (1, 2):
+            if len(rest) >= width and rest[0] != '0':
+                length = int(rest[:width])
+                if (not lengths or length >= lengths[-1]) and sum(lengths) + length <= 26:
+                    read(rest[width:], lengths + [length])
+    read(signature, [])
+    return readings
+
+def cycle_structure(perm):
+    '''
+    Splits a partial permutation (26 values, UNKNOWN where not yet seen) into closed cycles and open fragments.
+    Letters that are not linked to anything yet are fragments of length one.
+
+    Returns (cycles, fragments) as lists of letter strings. Raises ValueError if two letters map to the same letter.
+    '''
+    inverse = [UNKNOWN]*26
+    for a, b in enumerate(perm):
+        if b != UNKNOWN:
+            if inverse[b] != UNKNOWN:
+                raise ValueError(ALPHABET[inverse[b]] + ' and ' + ALPHABET[a] + ' both map to ' + ALPHABET[b] +
+                                 ', so this is not a permutation.')
+            inverse[b] = a
+    cycles = []
+    fragments = []
+    seen = [False]*26
+    # Fragments start at a letter with no known preimage.
+    for start in range(26):
+        if inverse[start] == UNKNOWN:
+            fragment = ''
+            letter = start
+            while letter != UNKNOWN:
+                seen[letter] = True
+                fragment += ALPHABET[letter]
+                letter = perm[letter]
+            fragments.append(fragment)
+    # Everything left over lies on a closed cycle.
+    for start in range(26):
+        if not seen[start]:
+            cycle = ''
+            letter = start
+            while not seen[letter]:
+                seen[letter] = True
+                cycle += ALPHABET[letter]
+                letter = perm[letter]
+            cycles.append(cycle)
+    return cycles, fragments
+
+def fragments_fit(fragment_lengths, capacities):
+    '''
+    True if the fragments can be shared out among cycles of the given lengths without overfilling any of them.
+    Single letters fill whatever space is left, so only fragments longer than one letter are placed.
+    '''
+    fragments = sorted([length for length in fragment_lengths if length > 1], reverse=True)
+    if sum(fragment_lengths) != sum(capacities):
+        return False
+    def place(i, capacities):
+        if i == len(fragments):
+            return True
+        tried = set()
+        for j, capacity in enumerate(capacities):
+            # Cycles with the same room left are interchangeable.
+            if capacity >= fragments[i] and capacity not in tried:
+                tried.add(capacity)
+                if place(i + 1, capacities[:j] + (capacity - fragments[i],) + capacities[j + 1:]):
+                    return True
+        return False
+    return place(0, tuple(sorted(capacities, reverse=True)))
+
+def signature_compatible(signature, cycles, fragments):
+    '''
+    True if a catalog signature (e.g. '6677') could describe a permutation with these closed cycles and open fragments.
+    '''
+    for lengths in parse_signature(signature):
+        remaining = list(lengths)
+        try:
+            for cycle in cycles:
+                remaining.remove(len(cycle))
+        except ValueError:
+            continue
+        if fragments_fit([len(fragment) for fragment in fragments], remaining):
+            return True
+    return False
+
+def catalog_table(chains):
+    '''
+    Flattens a chains dictionary or a ChainCatalog into (signatures, ids, counts): the distinct signature strings, an (N, 3) array of AD/BE/CF signature numbers for each index, and the number of candidates for each index.
+    '''
+    if isinstance(chains, cat.ChainCatalog):
+        mask = (1 << cat.SIGNATURE_BITS) - 1
+        codes = chains.codes.astype(np.int64)
+        ids = np.stack([(codes >> shift) & mask for shift in (2*cat.SIGNATURE_BITS, cat.SIGNATURE_BITS, 0)], axis=1)
+        return list(chains.signatures), ids, np.diff(chains.starts.astype(np.int64))
+    signatures = sorted(set(sig for index in chains for sig in cat.split_index(index)))
+    signature_ids = {sig: i for i, sig in enumerate(signatures)}
+    ids = np.array([[signature_ids[sig] for sig in cat.split_index(index)] for index in chains], dtype=np.int64)
+    counts = np.array([len(candidates) for candidates in chains.values()], dtype=np.int64)
+    return signatures, ids.reshape(-1, 3), counts
+
+def permutation_array(permutation):
+    '''
+    Converts a partial permutation given as a dictionary (None where unknown, as from generate_permutation_dicts) into a 26 byte array with UNKNOWN for missing entries. Arrays are returned unchanged.
+
+    Garbled intercepts can make generate_permutation_dicts send two letters to the same letter; that raises ValueError here rather than giving a meaningless (or endless) cycle walk later.
+    '''
+    if isinstance(permutation, dict):
+        perm = bytearray([UNKNOWN])*26
+        for a, b in permutation.items():
+            if b is not None:
+                perm[ALPHABET.index(a.upper())] = ALPHABET.index(b.upper())
+    else:
+        perm = permutation
+    known = [b for b in perm if b != UNKNOWN]
+    if len(set(known)) != len(known):
+        raise ValueError('Two letters map to the same letter, so this is not a permutation.')
+    return perm
+
+class CatalogQuery():
+    '''
+    Answers "which catalog entries are compatible with these partially known AD, BE and CF permutations?" without scanning the catalog.
+
+    For each of AD, BE and CF and each distinct signature, a packed bitset marks the catalog indices with that signature in that position. A query works out which signatures are compatible with each partial permutation, ORs their bitsets, and ANDs the three results.
+    '''
+
+    def __init__(self, chains):
+        self.chains = chains
+        self.signatures, self.ids, self.counts = catalog_table(chains)
+        # bitsets[component][signature] is a packed array with one bit per catalog index.
+        self.bitsets = np.stack([np.packbits(self.ids[:, component][None, :] == np.arange(len(self.signatures))[:, None], axis=1)
+                                 for component in range(3)])
+        self._allowed = {}
+
+    def allowed_signatures(self, cycles, fragments):
+        '''
+        Boolean array marking the signatures compatible with a set of closed cycles and open fragments.
+        Only the lengths matter, so results are cached by length.
+        '''
+        shape = (tuple(sorted(len(cycle) for cycle in cycles)), tuple(sorted(len(fragment) for fragment in fragments)))
+        if shape not in self._allowed:
+            self._allowed[shape] = np.array([signature_compatible(sig, cycles, fragments) for sig in self.signatures],
+                                            dtype=bool)
+        return self._allowed[shape]
+
+    def mask(self, permutations):
+        '''
+        Returns a boolean array over the catalog indices for a list of three partial permutations (AD, BE, CF).
+        Each can be a dictionary with None for unknown letters, a 26 byte array, or a (cycles, fragments) pair of letter string lists as returned by cycle_structure.
+        '''
+        bits = None
+        for component, permutation in enumerate(permutations):
+            if isinstance(permutation, tuple):
+                cycles, fragments = permutation
+            else:
+                cycles, fragments = cycle_structure(permutation_array(permutation))
+            allowed = np.bitwise_or.reduce(self.bitsets[component][self.allowed_signatures(cycles, fragments)], axis=0)
+            bits = allowed if bits is None else bits & allowed
+        return np.unpackbits(bits, count=len(self.ids)).astype(bool)
+
+    def count(self, permutations):
+        '''
+        Number of (key, order) candidates compatible with the partial permutations.
+        '''
+        return int(self.counts[self.mask(permutations)].sum())
+
+    def indices(self, permutations):
+        '''
+        Catalog index strings compatible with the partial permutations.
+        '''
+        return ['AD:' + self.signatures[ad] + ' BE:' + self.signatures[be] + ' CF:' + self.signatures[cf]
+                for ad, be, cf in self.ids[self.mask(permutations)]]
+
+    def query(self, permutations):
+        '''
+        Every (key, order) candidate compatible with the partial permutations.
+        '''
+        return [candidate for index in self.indices(permutations) for candidate in self.chains[index]]
+
+class IndicatorCollector():
+    '''
+    Collects six-letter indicators one at a time and tracks the partial AD, BE and CF permutations.
+
+    If a chains dictionary or ChainCatalog is given, add() reports how many (key, order) candidates are still consistent with what has been seen.
+    '''
+
+    def __init__(self, chains=None):
+        self.chains = chains
+        self.permutations = [bytearray([UNKNOWN])*26 for i in range(3)]
+        self.count = 0
+        # Indicators that contradicted an earlier one (a garbled intercept, say).
+        self.conflicts = 0
+        self.query = None if chains is None else CatalogQuery(chains)
+
+    def __repr__(self):
+        return 'IndicatorCollector: ' + str(self.count) + ' indicators, ' + str(self.known()) + ' of 78 letters known'
+
+    def known(self):
+        '''
+        Number of AD, BE and CF entries filled in so far (78 when complete).
+        '''
+        return sum(26 - perm.count(UNKNOWN) for perm in self.permutations)
+
+    def complete(self):
+        return self.known() == 78
+
+    def add(self, indicator):
+        '''
+        Adds one doubled message key encryption such as 'DMQVBN'.
+        Returns the number of consistent catalog candidates, or None if no catalog was given.
+        '''
+        indicator = indicator.upper()
+        self.count += 1
+        for i, perm in enumerate(self.permutations):
+            a, b = ALPHABET.index(indicator[i]), ALPHABET.index(indicator[i + 3])
+            if perm[a] == UNKNOWN and b not in perm:
+                perm[a] = b
+            elif perm[a] != b:
+                self.conflicts += 1
+        if self.chains is not None:
+            return self.candidate_count()
+
+    def add_many(self, indicators):
+        '''
+        Generator that adds indicators from any iterable or stream and yields the candidate count after each one.
+        '''
+        for indicator in indicators:
+            indicator = indicator.strip()
+            if indicator:
+                yield self.add(indicator)
+
+    def structures(self):
+        '''
+        Returns the (cycles, fragments) of AD, BE and CF, see cycle_structure.
+        '''
+        return [cycle_structure(perm) for perm in self.permutations]
+
+    def permutation_dicts(self):
+        '''
+        Returns AD, BE and CF as dictionaries, in the form generate_permutation_dicts uses (None where unknown).
+        '''
+        return [{ALPHABET[a]: None if b == UNKNOWN else ALPHABET[b] for a, b in enumerate(perm)}
+                for perm in self.permutations]
+
+    def consistent(self):
+        '''
+        Returns a boolean array marking the catalog indices still consistent with the indicators.
+        '''
+        return self.query.mask(self.permutations)
+
+    def candidate_count(self):
+        '''
+        Number of (key, order) candidates in the catalog that are still consistent.
+        '''
+        return self.query.count(self.permutations)
+
+    def consistent_indices(self):
+        '''
+        Returns the catalog index strings that are still consistent.
+        '''
+        return self.query.indices(self.permutations)
+
+    def candidates(self):
+        '''
+        Returns every (key, order) candidate that is still consistent.
+        '''
+        return self.query.query(self.permutations)
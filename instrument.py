@@ -0,0 +1,218 @@
+#! /usr/bin/python
+"""
+Module containing opt-in counters and timers for the machine and attack code.
+
+Instrumentation is off by default. Hot paths check the module flag before doing any work:
+
+    if instrument.enabled:
+        instrument.count('letters', len(codes))
+
+so a disabled build pays one attribute lookup per call. Turn it on for a block of code with
+
+    with instrument.instrumented(MemorySink()) as sinks:
+        ...
+    print(sinks[0].snapshot)
+
+Counters currently recorded:
+
+- letters = letters enciphered by any engine (Enigma, CompiledEnigma, batch).
+- rotor.<rotor>.steps, rotor.<rotor>.turnovers = steps of each rotor (by rotor number, e.g. rotor.II.steps) and how often it carried into its neighbour.
+- machine.rebuilds = rotors rebuilt by Enigma.set_rotor_order.
+- compiled.builds = machine settings compiled into lookup tables (settings cache misses).
+- catalog.combinations = (day key, rotor order) settings processed by rejewski.make_chain_length_dict.
+- candidates.tested = candidates scored by candidates.rank_candidates.
+
+Timers record the number of calls and total seconds for a named block (see timer). Events (see event) are passed straight to the sinks, e.g. progress reports while the chain catalog is built or the Rotor.encode_letter trace.
+
+Counters live in the current process. Work done inside multiprocessing pools is counted by the parent as results come back.
+"""
+# Import helpful tools
+from contextlib import contextmanager
+import cProfile
+import json
+import pstats
+import time
+
+# Checked by the instrumented code. Use enable/disable rather than setting it directly.
+enabled = False
+
+_counters = {}
+_timers = {}
+_sinks = []
+
+def count(name, n=1):
+    '''
+    Adds n to a counter. Callers on hot paths should check instrument.enabled first.
+    '''
+    _counters[name] = _counters.get(name, 0) + n
+
+class _Timer():
+    '''
+    Context manager that adds the time spent inside it to a named timer.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        calls, seconds = _timers.get(self.name, (0, 0.0))
+        _timers[self.name] = (calls + 1, seconds + elapsed)
+        return False
+
+class _NullTimer():
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+def timer(name):
+    '''
+    Returns a context manager timing a block under name, or a shared do-nothing one when instrumentation is off.
+    '''
+    return _Timer(name) if enabled else _NULL_TIMER
+
+def event(kind, **fields):
+    '''
+    Sends an event (a dictionary with the event kind, a timestamp and the given fields) to every sink.
+    '''
+    if enabled:
+        record = dict(fields, event=kind, time=time.time())
+        for sink in _sinks:
+            sink.event(record)
+
+def snapshot():
+    '''
+    Returns the current counters and timers as a plain dictionary.
+    '''
+    return {'counters': dict(_counters),
+            'timers': {name: {'calls': calls, 'seconds': seconds} for name, (calls, seconds) in _timers.items()}}
+
+def reset():
+    '''
+    Clears every counter and timer.
+    '''
+    _counters.clear()
+    _timers.clear()
+
+def enable(*sinks):
+    '''
+    Turns instrumentation on and starts the given sinks.
+    '''
+    global enabled
+    _sinks[:] = sinks
+    for sink in _sinks:
+        sink.start()
+    enabled = True
+
+def disable():
+    '''
+    Turns instrumentation off, hands the final snapshot to every sink and returns it.
+    '''
+    global enabled
+    enabled = False
+    final = snapshot()
+    for sink in _sinks:
+        sink.stop(final)
+    _sinks[:] = []
+    return final
+
+@contextmanager
+def instrumented(*sinks, fresh=True):
+    '''
+    Context manager that enables instrumentation for a block and yields the list of sinks.
+    fresh = start from zeroed counters and timers.
+    '''
+    if fresh:
+        reset()
+    enable(*sinks)
+    try:
+        yield list(sinks)
+    finally:
+        disable()
+
+class Sink():
+    '''
+    Base class for sinks. Subclasses override whichever of start, event and stop they need.
+    '''
+
+    def start(self):
+        pass
+
+    def event(self, record):
+        pass
+
+    def stop(self, snapshot):
+        pass
+
+class MemorySink(Sink):
+    '''
+    Keeps events in a list and the final snapshot in self.snapshot.
+    '''
+
+    def __init__(self, keep_events=True):
+        self.keep_events = keep_events
+        self.events = []
+        self.snapshot = None
+
+    def event(self, record):
+        if self.keep_events:
+            self.events.append(record)
+
+    def stop(self, snapshot):
+        self.snapshot = snapshot
+
+class JsonLinesSink(Sink):
+    '''
+    Writes each event, then the final snapshot, as one JSON object per line.
+
+    target = path to append to, or an open text file (which is left open).
+    '''
+
+    def __init__(self, target):
+        self.target = target
+        self.file = None
+
+    def start(self):
+        self.file = open(self.target, 'a') if isinstance(self.target, str) else self.target
+
+    def event(self, record):
+        self.file.write(json.dumps(record) + '\n')
+
+    def stop(self, snapshot):
+        self.file.write(json.dumps(dict(snapshot, event='snapshot', time=time.time())) + '\n')
+        if isinstance(self.target, str):
+            self.file.close()
+        else:
+            self.file.flush()
+        self.file = None
+
+class ProfileSink(Sink):
+    '''
+    Runs cProfile while instrumentation is enabled.
+
+    path = if given, the profile is saved there with dump_stats when instrumentation is disabled.
+    Use print_stats (or self.profile) afterwards to look at the results.
+    '''
+
+    def __init__(self, path=None):
+        self.path = path
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self, snapshot):
+        self.profile.disable()
+        if self.path is not None:
+            self.profile.dump_stats(self.path)
+
+    def print_stats(self, sort='cumulative', limit=20):
+        pstats.Stats(self.profile).sort_stats(sort).print_stats(limit)
@@ -7,12 +7,21 @@ Date: April 6, 2018
 
 Details: This file holds the code necessary to actually run the Enigma machine simulation. It draws on the components file to provide the constituent parts of the machine and implements a command line interface to operate the encryption process.
 
-Specifications: In particular, this module implements the 3 rotor Enigma machine with plugboard and reflector used by the German army during WWII. It may later be expanded to include a selection of 5 possible rotors, but right now it will use the hardcoded 3 rotor version for the purposes of simplicity.
+Specifications: In particular, this module implements the 3 rotor Enigma machine with plugboard and reflector used by the German army during WWII, with any three of rotors I - VIII, ring settings and a choice of reflector (see wheels.json). A Greek wheel (Beta or Gamma) and a thin reflector make the 4 rotor naval machine.
 '''
 # Module imports.
+import argparse
 import re
+import sys
+from functools import partial
 
 from components import Rotor, Plugboard, Reflector, ALPHABET
+from wheels import REGISTRY
+from compiled import compile_machine, advance_offsets, INVALID_CHARS
+import instrument
+
+ORDER_MESSAGE = ('Please provide three rotors from ' + ', '.join(REGISTRY.rotors) + ' as the left, middle and right rotors, '
+                 'optionally followed by one of ' + ', '.join(REGISTRY.greek) + ' as a fourth.')
 
 class Enigma():
     '''
@@ -25,27 +34,41 @@ class Enigma():
     The generic initial rotor ordering (which can be changed by the user) is L = I, M = II, R = III (I,II,III are the three Wehrmacht Enigma rotors defined in components.py)
     '''
 
-    def __init__(self, key='AAA', swaps=None, rotor_order=['I', 'II', 'III']):
+    def __init__(self, key='AAA', swaps=None, rotor_order=['I', 'II', 'III'], compiled=False, rings=None, reflector=None):
         '''
         Initializes the Enigma machine.
 
-        key = Three letter string specifying the top/visible letter for the left, middle, and right rotors respectively. This determines indexing in the rotor.
+        key = Three letter string specifying the top/visible letter for the left, middle, and right rotors respectively. This determines indexing in the rotor. A four-rotor machine takes a fourth letter for the Greek wheel.
 
         swaps = Specifies which plugboard swaps you would like to implement, if any. These should be provided in the form [('A', 'B'), ('T', 'G')] if you want to swap A,B and T,G.
 
-        rotor_order = Defines which rotor to set as the left, middle, and right rotors respectively when considering the Enigma geometrically as described above.
+        rotor_order = Defines which rotor to set as the left, middle, and right rotors respectively when considering the Enigma geometrically as described above. Any of rotors I - VIII may be used (see wheels.json). A fourth entry (Beta or Gamma) makes a four-rotor machine, with the Greek wheel between the right rotor and the reflector.
+
+        compiled = If True, encipher runs on integer lookup tables (see compiled.py) instead of walking the rotors letter by letter. The output and the final rotor windows are the same either way.
+
+        rings = Ring settings (Ringstellung), one letter per rotor such as 'AAA'. Defaults to the ring settings in wheels.json, which are all A.
+
+        reflector = Reflector name from wheels.json. Defaults to B, or B-thin on a four-rotor machine.
         '''
-        if len(key) != 3:
-            print('Please provide a three letter string as the initial window setting.')
+        if len(key) not in (3, 4) or len(key) != len(rotor_order):
+            print('Please provide a three letter string as the initial window setting (four letters for a four-rotor machine).')
+            return None
+        if not REGISTRY.valid_order(rotor_order):
+            print(ORDER_MESSAGE)
             return None
         # Set the key and rotor order.
         self.key = key
         self.rotor_order = rotor_order
+        self.compiled = compiled
+        self.rings = rings
+        ring_letters = [None]*len(rotor_order) if rings is None else list(rings)
         # Now define the components.
-        self.r_rotor = Rotor(rotor_order[2], key[2])
-        self.m_rotor = Rotor(rotor_order[1], key[1], self.r_rotor)
-        self.l_rotor = Rotor(rotor_order[0], key[0], self.m_rotor)
-        self.reflector = Reflector()
+        self.r_rotor = Rotor(rotor_order[2], key[2], ring_letter=ring_letters[2])
+        self.m_rotor = Rotor(rotor_order[1], key[1], self.r_rotor, ring_letter=ring_letters[1])
+        self.l_rotor = Rotor(rotor_order[0], key[0], self.m_rotor, ring_letter=ring_letters[0])
+        # The Greek wheel is not linked to the other rotors since it never steps.
+        self.greek_rotor = Rotor(rotor_order[3], key[3], ring_letter=ring_letters[3]) if len(rotor_order) == 4 else None
+        self.reflector = Reflector(reflector or REGISTRY.default_reflector(rotor_order))
         self.plugboard = Plugboard(swaps)
         # Define prev_rotor information for middle and right rotors.
         self.m_rotor.prev_rotor = self.l_rotor
@@ -55,7 +78,8 @@ class Enigma():
         print('Keyboard <-> Plugboard <->  Rotor ' + self.rotor_order[0]
               + ' <-> Rotor ' + self.rotor_order[1]
               + ' <-> Rotor ' + self.rotor_order[2]
-              + ' <-> Reflector ')
+              + (' <-> Rotor ' + self.greek_rotor.rotor_num if self.greek_rotor else '')
+              + ' <-> Reflector ' + self.reflector.name)
         return 'Key: ' + self.key
 
     def encipher(self, message):
@@ -64,12 +88,64 @@ class Enigma():
         """
         cipher = ''
         # Test the message string to make sure it only contains a-zA-Z
-        if bool(re.compile(r'[^a-zA-Z ]').search(message)):
+        if bool(INVALID_CHARS.search(message)):
             return 'Please provide a string containing only the characters a-zA-Z and spaces.'
+        if self.compiled:
+            return self.encipher_compiled(message)
         for letter in message.upper().replace(" ", "").strip():
             cipher += self.encode_decode_letter(letter)
         return cipher
 
+    def encipher_compiled(self, message):
+        '''
+        Enciphers a message with lookup tables built from the current machine state, then moves the rotor windows to where letter by letter encryption would have left them.
+        '''
+        engine = compile_machine(self)
+        cipher = engine.encipher(message)
+        self.sync_rotors(engine)
+        return cipher
+
+    def encipher_into(self, data, out):
+        '''
+        Enciphers a bytes-like buffer into a caller-supplied writable buffer and returns the number of letters written (see CompiledEnigma.encipher_into).
+        The rotors are left where encipher would have left them.
+        '''
+        engine = compile_machine(self)
+        count = engine.encipher_into(data, out)
+        self.sync_rotors(engine)
+        return count
+
+    def encipher_stream(self, chunks, non_letters='drop'):
+        '''
+        Generator that enciphers an iterable of chunks (bytes or str) and yields the output chunk by chunk, so input of any size runs in constant memory.
+        The rotor state carries across chunk boundaries and the machine is left where it would be after enciphering the whole stream.
+
+        non_letters = 'drop', 'pass' or 'error' (see CompiledEnigma.encipher_chunk).
+        '''
+        engine = compile_machine(self)
+        for chunk in chunks:
+            cipher = engine.encipher_chunk(chunk, non_letters)
+            self.sync_rotors(engine)
+            yield cipher
+
+    def advance(self, steps):
+        '''
+        Moves the rotors to where they would be after enciphering steps more letters, in constant time.
+        '''
+        rotors = [self.l_rotor, self.m_rotor, self.r_rotor]
+        notches = [[ALPHABET.index(notch) for notch in rotor.notch] for rotor in rotors[:2]]
+        offsets = advance_offsets([rotor.offset for rotor in rotors], notches, steps)
+        for rotor, offset in zip(rotors, offsets):
+            rotor.change_setting(ALPHABET[offset])
+
+    def sync_rotors(self, engine):
+        '''
+        Moves the rotor windows to match the offsets of a CompiledEnigma.
+        '''
+        self.l_rotor.change_setting(ALPHABET[engine.offsets[0]])
+        self.m_rotor.change_setting(ALPHABET[engine.offsets[1]])
+        self.r_rotor.change_setting(ALPHABET[engine.offsets[2]])
+
     def decipher(self, message):
         """
         Encryption == decryption.
@@ -81,8 +157,10 @@ class Enigma():
         Because Enigma is symmetrical, this works the same whether you encode or decode.
         """
         # Make sure the letter is in a-zA-Z.
-        if bool(re.compile(r'[^a-zA-Z ]').search(letter)):
+        if bool(INVALID_CHARS.search(letter)):
             return 'Please provide a letter in a-zA-Z.'
+        if instrument.enabled:
+            instrument.count('letters')
         # First, go through plugboard.
         if letter in self.plugboard.swaps:
             letter = self.plugboard.swaps[letter.upper()]
@@ -91,8 +169,13 @@ class Enigma():
         # Send the letter through the rotors to the reflector.
         # Get the index of the letter that emerges from the rotor.
         left_pass = self.l_rotor.encode_letter(ALPHABET.index(letter.upper()))
+        # On a four-rotor machine the Greek wheel sits between the right rotor and the reflector.
+        if self.greek_rotor:
+            left_pass = self.greek_rotor.encode_letter(left_pass)
         # Must match letter INDEX, not letter name to reflector as before. 
         refl_output = self.reflector.wiring[ALPHABET[(left_pass)%26]]
+        if self.greek_rotor:
+            refl_output = ALPHABET[self.greek_rotor.encode_letter(ALPHABET.index(refl_output), forward=False)]
         # Send the reflected letter back through the rotors.
         final_letter = ALPHABET[self.r_rotor.encode_letter(
             ALPHABET.index(refl_output), forward=False)]
@@ -106,11 +189,13 @@ class Enigma():
         Updates the visible window settings of the Enigma machine, rotating the rotors.
         The syntax for the rotor position key is three letter string of the form 'AAA' or 'ZEK'.
         '''
-        if type(position_key)==str and len(position_key)==3:
+        if type(position_key)==str and len(position_key)==len(self.key):
             self.key = position_key
             self.l_rotor.change_setting(self.key[0])
             self.m_rotor.change_setting(self.key[1])
             self.r_rotor.change_setting(self.key[2])
+            if self.greek_rotor:
+                self.greek_rotor.change_setting(self.key[3])
             if printIt:
                 print('Rotor position successfully updated. Now using ' + self.key + '.')
         else:
@@ -120,11 +205,24 @@ class Enigma():
         '''
         Changes the order of rotors in the Engima machine to match that specified by the user.
         The syntax for the rotor order is a list of the form ['I', 'II', 'III'], where 'I' is the left rotor, 'II' is the middle rotor, and 'III' is the right rotor. 
+        A four-rotor machine takes a fourth entry for the Greek wheel. The number of rotors cannot change, since the key, ring settings and reflector are made for it.
         '''
+        if len(order) != len(self.rotor_order):
+            print('Please provide ' + str(len(self.rotor_order)) + ' rotors; build a new Enigma to change the number of rotors.')
+            return None
+        if not REGISTRY.valid_order(order):
+            print(ORDER_MESSAGE)
+            return None
+        if instrument.enabled:
+            instrument.count('machine.rebuilds')
+        ring_letters = [None]*len(order) if self.rings is None else list(self.rings)
         # Now define the components.
-        self.r_rotor = Rotor(order[2], self.key[2])
-        self.m_rotor = Rotor(order[1], self.key[1], self.r_rotor)
-        self.l_rotor = Rotor(order[0], self.key[0], self.m_rotor)
+        self.r_rotor = Rotor(order[2], self.key[2], ring_letter=ring_letters[2])
+        self.m_rotor = Rotor(order[1], self.key[1], self.r_rotor, ring_letter=ring_letters[1])
+        self.l_rotor = Rotor(order[0], self.key[0], self.m_rotor, ring_letter=ring_letters[0])
+        if len(order) == 4:
+            self.greek_rotor = Rotor(order[3], self.key[3], ring_letter=ring_letters[3])
+        self.rotor_order = order
         # Define prev_rotor information for middle and right rotors.
         self.m_rotor.prev_rotor = self.l_rotor
         self.r_rotor.prev_rotor = self.m_rotor
@@ -139,3 +237,63 @@ class Enigma():
        # print('Plugboard successfully updated. New swaps are:')
        # for s in self.plugboard.swaps:
        #     print(s)       
+
+
+def encipher_file(infile, outfile, key='AAA', swaps=None, rotor_order=['I', 'II', 'III'], non_letters='drop', chunk_size=1 << 20,
+                  rings=None, reflector=None):
+    '''
+    Enciphers everything readable from infile and writes it to outfile, chunk_size at a time.
+    Both files must be opened in the same mode (binary or text).
+    '''
+    enigma = Enigma(key, swaps, rotor_order, rings=rings, reflector=reflector)
+    # read(0) returns the empty bytes or str that marks the end of the file.
+    chunks = iter(partial(infile.read, chunk_size), infile.read(0))
+    for cipher in enigma.encipher_stream(chunks, non_letters):
+        outfile.write(cipher)
+
+def main(argv=None):
+    '''
+    Command line interface: python -m machine [options] [infile]
+    '''
+    parser = argparse.ArgumentParser(prog='python -m machine',
+                                     description='Encipher or decipher text with an Enigma machine.')
+    parser.add_argument('infile', nargs='?', help='file to read (default: stdin)')
+    parser.add_argument('-o', '--output', help='file to write (default: stdout)')
+    parser.add_argument('-k', '--key', default='AAA', help='three letter rotor position, e.g. TDS (four with a Greek wheel)')
+    parser.add_argument('-r', '--rotors', nargs='+', default=['I', 'II', 'III'], metavar='ROTOR',
+                        help='left, middle and right rotors, e.g. II I III, optionally followed by a Greek wheel')
+    parser.add_argument('--rings', help='ring settings, one letter per rotor, e.g. AAA')
+    parser.add_argument('--reflector', choices=list(REGISTRY.reflectors), help='reflector (default B, or B-thin with a Greek wheel)')
+    parser.add_argument('-p', '--plugs', nargs='*', default=[], metavar='PAIR',
+                        help='plugboard swaps, e.g. AB CD')
+    parser.add_argument('-n', '--non-letters', choices=['drop', 'pass', 'error'], default='drop',
+                        help='what to do with characters that are not letters')
+    parser.add_argument('--chunk-size', type=int, default=1 << 20, help='bytes read at a time')
+    args = parser.parse_args(argv)
+    if not REGISTRY.valid_order(args.rotors):
+        parser.error('give three rotors from ' + ', '.join(REGISTRY.rotors) + ' and optionally one of ' + ', '.join(REGISTRY.greek))
+    if len(args.key) != len(args.rotors) or re.search(r'[^a-zA-Z]', args.key):
+        parser.error('the key must be one letter per rotor')
+    if args.rings is not None and (len(args.rings) != len(args.rotors) or re.search(r'[^a-zA-Z]', args.rings)):
+        parser.error('the ring settings must be one letter per rotor')
+    if any(len(plug) != 2 or re.search(r'[^a-zA-Z]', plug) for plug in args.plugs):
+        parser.error('each plug must be a pair of letters, e.g. AB')
+    if len(set(''.join(args.plugs).upper())) != 2*len(args.plugs):
+        parser.error('each letter can only be plugged once')
+    infile = open(args.infile, 'rb') if args.infile else sys.stdin.buffer
+    outfile = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        encipher_file(infile, outfile, args.key.upper(), [plug.upper() for plug in args.plugs], args.rotors,
+                      args.non_letters, args.chunk_size, args.rings, args.reflector)
+    except ValueError as error:
+        sys.exit(str(error))
+    finally:
+        if args.infile:
+            infile.close()
+        if args.output:
+            outfile.close()
+        else:
+            outfile.flush()
+
+if __name__ == '__main__':
+    main()
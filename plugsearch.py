@@ -0,0 +1,204 @@
+#! /usr/bin/python
+"""
+Module containing code to recover the plugboard once the rotor order and rotor position are known.
+
+With the rotors fixed, letter t of a message is enciphered as P(S_t(P(c))), where S_t is the scrambler (rotors and reflector) at keystroke t and P is the plugboard. The scrambler tables are computed once; the plugboard is then searched by hill-climbing (or simulated annealing) on English letter fitness.
+
+Rescoring is incremental: a move only changes the plugboard on a handful of letters, so only the keystrokes whose ciphertext letter or scrambler input involves one of those letters are deciphered again, and the score is adjusted by the difference. Independent random restarts run on separate processes.
+"""
+# Import helpful tools
+from functools import partial
+from multiprocessing import Pool
+import math
+import random as r
+
+import numpy as np
+
+# Import enigma stuff
+from components import Plugboard, ALPHABET
+from compiled import normalize_message
+import batch
+from scoring import ENGLISH_LOG_PROBS
+
+def scrambler_tables(ciphertexts, key, rotor_order):
+    '''
+    Returns the letter indices of the ciphertexts (flattened) and, for each of those keystrokes, the 26 entry scrambler table with no plugboard.
+    Every message is assumed to start from the same rotor position key.
+    '''
+    codes = []
+    tables = []
+    for ciphertext in ciphertexts:
+        message = normalize_message(ciphertext)
+        scrambled = batch.scrambler_tables_at(batch.key_offsets([key]), batch.order_ids([rotor_order]),
+                                              np.arange(1, len(message) + 1))
+        codes.extend(message)
+        tables.extend(scrambled[0].tolist())
+    return codes, tables
+
+def count_plugs(plugs):
+    '''
+    Number of swapped pairs in a plugboard permutation.
+    '''
+    return sum(1 for a, b in enumerate(plugs) if a < b)
+
+class PlugboardClimber():
+    '''
+    Holds the decryption of a set of ciphertexts under a plugboard and keeps its score up to date as the plugboard changes.
+    '''
+
+    def __init__(self, codes, tables, plugs=None):
+        self.codes = codes
+        self.tables = tables
+        self.plugs = list(range(26)) if plugs is None else list(plugs)
+        # Keystrokes grouped by ciphertext letter never change.
+        self.by_cipher = [[] for i in range(26)]
+        for t, code in enumerate(codes):
+            self.by_cipher[code].append(t)
+        # inner[t] is the scrambler output at keystroke t, before the plugboard is applied on the way out.
+        self.inner = [tables[t][self.plugs[code]] for t, code in enumerate(codes)]
+        self.by_inner = [set() for i in range(26)]
+        for t, letter in enumerate(self.inner):
+            self.by_inner[letter].add(t)
+        self.score = sum(ENGLISH_LOG_PROBS[self.plugs[letter]] for letter in self.inner)
+
+    def swaps(self):
+        '''
+        Returns the current plugboard as a list of swaps such as ['AB', 'CD'].
+        '''
+        return [ALPHABET[a] + ALPHABET[b] for a, b in enumerate(self.plugs) if a < b]
+
+    def fitness(self):
+        '''
+        Mean log probability per letter (see scoring.english_fitness).
+        '''
+        return self.score/max(len(self.codes), 1)
+
+    def connect(self, a, b):
+        '''
+        Returns the plugboard with a and b plugged together (or unplugged, if they already are), freeing their old partners.
+        '''
+        plugs = list(self.plugs)
+        if plugs[a] == b:
+            plugs[a], plugs[b] = a, b
+        else:
+            plugs[plugs[a]] = plugs[a]
+            plugs[plugs[b]] = plugs[b]
+            plugs[a], plugs[b] = b, a
+        return plugs
+
+    def evaluate(self, plugs):
+        '''
+        Scores a new plugboard by re-deciphering only the keystrokes it affects.
+        Returns (score change, list of (keystroke, new inner letter)).
+        '''
+        changed = [letter for letter in range(26) if plugs[letter] != self.plugs[letter]]
+        affected = set()
+        for letter in changed:
+            affected.update(self.by_cipher[letter])
+            affected.update(self.by_inner[letter])
+        delta = 0.0
+        updates = []
+        for t in affected:
+            old = self.inner[t]
+            new = self.tables[t][plugs[self.codes[t]]]
+            delta += ENGLISH_LOG_PROBS[plugs[new]] - ENGLISH_LOG_PROBS[self.plugs[old]]
+            updates.append((t, new))
+        return delta, updates
+
+    def apply(self, plugs, delta, updates):
+        '''
+        Commits a plugboard that was scored with evaluate.
+        '''
+        for t, new in updates:
+            self.by_inner[self.inner[t]].discard(t)
+            self.by_inner[new].add(t)
+            self.inner[t] = new
+        self.plugs = plugs
+        self.score += delta
+
+    def hill_climb(self, max_plugs=6, rng=r):
+        '''
+        Tries every pair of letters, keeping any change that improves the score, until a full pass finds nothing better.
+        '''
+        pairs = [(a, b) for a in range(26) for b in range(a + 1, 26)]
+        improved = True
+        while improved:
+            improved = False
+            rng.shuffle(pairs)
+            for a, b in pairs:
+                plugs = self.connect(a, b)
+                if count_plugs(plugs) > max_plugs:
+                    continue
+                delta, updates = self.evaluate(plugs)
+                if delta > 1e-9:
+                    self.apply(plugs, delta, updates)
+                    improved = True
+
+    def anneal(self, max_plugs=6, iterations=20000, start_temperature=2.0, rng=r):
+        '''
+        Simulated annealing over random pair changes, ending with a hill climb from the best plugboard seen.
+        '''
+        best = (self.score, list(self.plugs))
+        for i in range(iterations):
+            temperature = start_temperature*(1 - i/float(iterations)) + 1e-3
+            a, b = rng.sample(range(26), 2)
+            plugs = self.connect(a, b)
+            if count_plugs(plugs) > max_plugs:
+                continue
+            delta, updates = self.evaluate(plugs)
+            if delta > 0 or rng.random() < math.exp(delta/temperature):
+                self.apply(plugs, delta, updates)
+                if self.score > best[0]:
+                    best = (self.score, list(self.plugs))
+        delta, updates = self.evaluate(best[1])
+        self.apply(best[1], delta, updates)
+        self.hill_climb(max_plugs, rng)
+
+def random_plugs(count, rng):
+    '''
+    Returns a random plugboard permutation with count pairs.
+    '''
+    letters = rng.sample(range(26), 2*count)
+    plugs = list(range(26))
+    for i in range(0, 2*count, 2):
+        plugs[letters[i]], plugs[letters[i + 1]] = letters[i + 1], letters[i]
+    return plugs
+
+def _restart(restart, codes, tables, max_plugs, method, iterations, seed):
+    '''
+    Worker task for solve_plugboard: one search from a random starting plugboard.
+    '''
+    rng = r.Random(seed*100003 + restart)
+    # The first restart starts from an empty plugboard.
+    climber = PlugboardClimber(codes, tables, random_plugs(rng.randint(0, max_plugs), rng) if restart else None)
+    if method == 'anneal':
+        climber.anneal(max_plugs, iterations, rng=rng)
+    else:
+        climber.hill_climb(max_plugs, rng)
+    return climber.fitness(), climber.swaps()
+
+def solve_plugboard(ciphertexts, key, rotor_order, restarts=8, workers=None, max_plugs=6, method='hill',
+                    iterations=20000, seed=0):
+    '''
+    Recovers plugboard swaps for known rotor settings.
+
+    ciphertexts = a ciphertext string or a list of them, each sent from rotor position key.
+    key, rotor_order = the rotor position and order, e.g. 'TDS' and ['II', 'I', 'III'].
+    restarts = number of independent searches; they run in a process pool unless workers == 1.
+    max_plugs = largest number of swaps to consider (Plugboard allows 6).
+    method = 'hill' for hill-climbing or 'anneal' for simulated annealing with the given number of iterations.
+
+    Returns (Plugboard, score), where score is the mean English log probability per letter of the decryption.
+    '''
+    if isinstance(ciphertexts, str):
+        ciphertexts = [ciphertexts]
+    codes, tables = scrambler_tables(ciphertexts, key, rotor_order)
+    task = partial(_restart, codes=codes, tables=tables, max_plugs=max_plugs, method=method, iterations=iterations,
+                   seed=seed)
+    if workers == 1:
+        results = [task(restart) for restart in range(restarts)]
+    else:
+        with Pool(workers) as pool:
+            results = pool.map(task, range(restarts))
+    score, swaps = max(results, key=lambda result: result[0])
+    return Plugboard(swaps), score
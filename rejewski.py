@@ -6,12 +6,21 @@ When you get stuck, Https://en.wikipedia.org/wiki/Grill_(cryptology) has a lot o
 """
 # Import helpful tools
 from tqdm import tqdm
-from itertools import permutations, product, chain
+from itertools import permutations, chain
+from functools import partial
+from multiprocessing import Pool
+import json
+import numpy as np
+import os
 import pickle
 import random as r
+import shutil
 
 # Import enigma stuff
 import machine
+import batch
+from components import ROTOR_WIRINGS
+import instrument
 
 # Messages for encryption with message key TDJTDJ
 msg1 = 'A calm and modest life brings more happiness than the pursuit of success combined with constant restlessness Albert Einstein'
@@ -35,42 +44,120 @@ Outline for how they will solve this so I don't forget.
 '''
 ############################## CODE TO GENERATE CHAIN DICTIONARY ##############################
 
-def make_chain_length_dict():
+def chain_indices(keys, orders):
     '''
-    Function to create the chains dictionary for all possible key/rotor combinations for Enigma.
+    Computes the chain index (see generate_chain_index) for a batch of day keys and rotor orders with no plugboard.
+
+    Rather than encrypting random message keys until the AD, BE and CF dictionaries fill up, this enciphers every letter at each of the first six positions and composes the resulting permutations directly: if position 1 sends x to c1 and position 4 sends x to c4, then AD maps c1 to c4.
+
+    Params: keys = (N, 3) array of rotor offsets, orders = (N, 3) array of rotor ids (see batch.py).
+    '''
+    count = len(keys)
+    letters = np.arange(26, dtype=np.uint8)
+    # One row per (setting, letter), enciphering that letter six times.
+    codes = np.repeat(letters[:, None], 6, axis=1)
+    cipher = batch.encipher_codes_batch(np.repeat(keys, 26, axis=0), np.repeat(orders, 26, axis=0),
+                                        None, np.tile(codes, (count, 1)))
+    cipher = cipher.reshape(count, 26, 6)
+    rows = np.arange(count)[:, None]
+    signatures = []
+    for first in range(3):
+        perms = np.zeros((count, 26), dtype=np.uint8)
+        perms[rows, cipher[:, :, first]] = cipher[:, :, first + 3]
+        signatures.append(cycle_signatures(perms))
+    return ['AD:' + ad + ' BE:' + be + ' CF:' + cf for ad, be, cf in zip(*signatures)]
+
+def cycle_signatures(perms):
+    '''
+    Given an (N, 26) array of permutations, returns the sorted cycle lengths of each as a string such as '6677'.
+    '''
+    rows = np.arange(len(perms))[:, None]
+    letters = np.arange(26)
+    lengths = np.zeros(perms.shape, dtype=np.uint8)
+    current = perms.copy()
+    # The cycle length of a letter is the first power of the permutation that sends it back to itself.
+    for power in range(1, 27):
+        lengths[(current == letters) & (lengths == 0)] = power
+        current = perms[rows, current]
+    # A cycle of length L shows up L times in the sorted lengths, so only format each distinct row once.
+    unique, inverse = np.unique(np.sort(lengths, axis=1), axis=0, return_inverse=True)
+    formatted = []
+    for row in unique:
+        signature = ''
+        i = 0
+        while i < 26:
+            signature += str(row[i])
+            i += row[i]
+        formatted.append(signature)
+    return [formatted[i] for i in inverse.reshape(-1)]
+
+def build_chain_chunk(first_letter, rotors, parts_dir):
+    '''
+    Worker task for make_chain_length_dict: computes every chain index for the day keys starting with first_letter and saves them as one part file.
     '''
-    # Define some variables (for now)
     alphabet = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
-    keys = product(alphabet, repeat=3) # Get the Cartesian product of 3 alphabets
-    enigma = machine.Enigma() # Create an enigma machine.
-    # For possible day key in the set of all day keys
+    orders = list(permutations(rotors, 3))
+    part = []
+    # One second letter at a time, so the batch arrays stay small even with all 336 rotor orders.
+    for second_letter in alphabet:
+        keys = [(alphabet[first_letter], second_letter, third_letter) for third_letter in alphabet]
+        settings = [(key, order) for key in keys for order in orders]
+        indices = chain_indices(batch.key_offsets([''.join(key) for key, order in settings]),
+                                batch.order_ids([order for key, order in settings]))
+        part.extend(zip(indices, settings))
+    # Write to a temporary name first so an interrupted run never leaves a truncated part behind.
+    path = os.path.join(parts_dir, 'part-%02d.pickle' % first_letter)
+    pickle.dump(part, open(path + '.tmp', 'wb'), protocol=2)
+    os.replace(path + '.tmp', path)
+    return first_letter
+
+def make_chain_length_dict(workers=None, output='./chains.pickle', resume=True, rotors=list(ROTOR_WIRINGS)):
+    '''
+    Function to create the chains dictionary for all possible key/rotor combinations for Enigma.
+
+    The key space is split by the first letter of the day key and spread across a process pool. Each finished slice is saved under output + '.parts', so an interrupted run picks up where it stopped when resume is True. Parts left by a run with different rotors are thrown away and rebuilt. The result is deterministic and lists candidates in the same (key, order) order as a serial sweep.
+
+    Params: workers = number of processes (defaults to the number of CPUs, 1 runs everything in this process).
+            output = path of the finished pickle.
+            resume = reuse part files left over from an earlier run.
+            rotors = the rotors whose three-rotor orderings are searched. All of rotors I - VIII by default, i.e. 336 orders and about 5.9 million settings; ['I', 'II', 'III'] gives the small six-order dictionary of the original attack.
+    '''
+    parts_dir = output + '.parts'
+    # The parts only fit together if they were built from the same rotors, so the rotors are recorded next to them.
+    manifest = os.path.join(parts_dir, 'rotors.json')
+    if os.path.isdir(parts_dir) and not (resume and os.path.exists(manifest) and json.load(open(manifest)) == list(rotors)):
+        shutil.rmtree(parts_dir)
+    if not os.path.isdir(parts_dir):
+        os.makedirs(parts_dir)
+        json.dump(list(rotors), open(manifest, 'w'))
+    todo = [first_letter for first_letter in range(26)
+            if not (resume and os.path.exists(os.path.join(parts_dir, 'part-%02d.pickle' % first_letter)))]
+    task = partial(build_chain_chunk, rotors=rotors, parts_dir=parts_dir)
+    # Settings covered by one part: every day key with the same first letter, under every rotor order.
+    part_size = 26*26*len(list(permutations(rotors, 3)))
+    def report(first_letter, done):
+        # Counted here rather than in the workers, whose counters are not sent back.
+        if instrument.enabled:
+            instrument.count('catalog.combinations', part_size)
+            instrument.event('catalog.progress', part=first_letter, done=done, total=len(todo))
+    with instrument.timer('catalog.build'):
+        if workers == 1:
+            for i, first_letter in enumerate(tqdm(todo)):
+                report(task(first_letter), i + 1)
+        else:
+            with Pool(workers) as pool:
+                for i, first_letter in enumerate(tqdm(pool.imap_unordered(task, todo), total=len(todo))):
+                    report(first_letter, i + 1)
+    # Merge the slices in key order.
     chains_dict = {}
-    for key in tqdm(keys):
-        # For rotor combination in rotors.
-        for order in permutations(['I', 'II', 'III']):
-            AD = {letter:None for letter in alphabet}
-            BE = {letter:None for letter in alphabet}
-            CF = {letter:None for letter in alphabet}
-            # While we haven't made full alphabets for AD, BE, CF perms for this day key and rotor combo.
-            enigma.set_rotor_order(order)
-            while any(AD[i] is None for i in AD) or any(BE[i] is None for i in BE) or any(CF[i] is None for i in CF):
-                # Reset the day key.
-                enigma.set_rotor_position(key[0] + key[1] + key[2])
-                # Encrypt the message key twice.
-                m_key = alphabet[r.randint(0,25)] + alphabet[r.randint(0,25)] + alphabet[r.randint(0,25)]
-                cipher = enigma.encipher(m_key + m_key)
-                # Take the cipher text and add it to the alphabet set for day key.
-                AD[cipher[0]] = cipher[3] if AD[cipher[0]] is None else AD[cipher[0]]
-                BE[cipher[1]] = cipher[4] if BE[cipher[1]] is None else BE[cipher[1]]
-                CF[cipher[2]] = cipher[5] if CF[cipher[2]] is None else CF[cipher[2]]
-            # Now make the chains from the dictionaries and generate dictionary index.
-            index = generate_chain_index(make_chains_from_permutation_dict([AD,BE,CF]))
-            # Deal with the case that you have multiple mappings to the same key pair.
+    for first_letter in range(26):
+        for index, setting in pickle.load(open(os.path.join(parts_dir, 'part-%02d.pickle' % first_letter), 'rb')):
             if index not in chains_dict:
-                chains_dict[index] = [(key, order)]
+                chains_dict[index] = [setting]
             else:
-                chains_dict[index].append((key,order))
-    pickle.dump(chains_dict, open('./chains.pickle', 'wb'), protocol=2)
+                chains_dict[index].append(setting)
+    pickle.dump(chains_dict, open(output, 'wb'), protocol=2)
+    shutil.rmtree(parts_dir)
     return chains_dict
 
 def generate_permutation_dicts(message_encrypts):
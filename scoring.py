@@ -0,0 +1,73 @@
+#! /usr/bin/python
+"""
+Module containing statistics for deciding whether a decryption looks like German/English text rather than noise.
+
+The attacks only need a number that is larger for "more language-like" text:
+
+- the index of coincidence (IoC) is about 0.066 for English, 0.076 for German and 0.038 for uniformly random letters, and it does not change under a plugboard swap or any other fixed letter substitution,
+- english_fitness is the average log probability of each letter under English letter frequencies, which does reward getting the plugboard right.
+"""
+# Import helpful tools
+import math
+
+import numpy as np
+
+ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+# Relative letter frequencies of English text, in percent.
+ENGLISH_FREQUENCIES = [8.167, 1.492, 2.782, 4.253, 12.702, 2.228, 2.015, 6.094, 6.966, 0.153, 0.772, 4.025, 2.406,
+                       6.749, 7.507, 1.929, 0.095, 5.987, 6.327, 9.056, 2.758, 0.978, 2.360, 0.150, 1.974, 0.074]
+ENGLISH_LOG_PROBS = [math.log(f/sum(ENGLISH_FREQUENCIES)) for f in ENGLISH_FREQUENCIES]
+
+# IoC of uniformly random letters and of typical English, for scaling thresholds.
+RANDOM_IOC = 1/26.0
+ENGLISH_IOC = 0.066
+
+def letter_counts(text):
+    '''
+    Counts the occurrences of each letter A-Z in a string (case-insensitive; everything else is ignored).
+    '''
+    text = text.upper()
+    return [text.count(letter) for letter in ALPHABET]
+
+def index_of_coincidence(text):
+    '''
+    Probability that two letters drawn from the text without replacement are equal.
+    '''
+    counts = letter_counts(text)
+    total = sum(counts)
+    if total < 2:
+        return 0.0
+    return sum(c*(c - 1) for c in counts)/float(total*(total - 1))
+
+def letter_counts_batch(codes):
+    '''
+    Counts the letters of each row of an (N, L) array of letter indices (0-25). Returns an (N, 26) array.
+    '''
+    codes = np.asarray(codes)
+    rows = len(codes)
+    # Give every row its own 26 bins so one bincount covers the whole array.
+    flat = (codes.astype(np.int64) + 26*np.arange(rows)[:, None]).ravel()
+    return np.bincount(flat, minlength=26*rows).reshape(rows, 26)
+
+def index_of_coincidence_batch(counts):
+    '''
+    Vectorized index_of_coincidence: takes an (N, 26) array of letter counts (see letter_counts_batch) and returns N scores.
+    '''
+    counts = np.asarray(counts, dtype=np.int64)
+    total = counts.sum(axis=1)
+    pairs = (counts*(counts - 1)).sum(axis=1)
+    return np.where(total > 1, pairs/np.maximum(total*(total - 1), 1).astype(float), 0.0)
+
+def english_fitness(text):
+    '''
+    Mean log probability per letter under English letter frequencies. Roughly -2.9 for English and -3.6 for random letters.
+    '''
+    counts = letter_counts(text)
+    total = sum(counts)
+    if total == 0:
+        return float('-inf')
+    return sum(c*p for c, p in zip(counts, ENGLISH_LOG_PROBS))/total
+
+# Scores that can be selected by name.
+SCORERS = {'ioc': index_of_coincidence, 'fitness': english_fitness}
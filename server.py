@@ -0,0 +1,436 @@
+#! /usr/bin/python
+"""
+Module containing an asyncio Enigma service for TCP or Unix sockets.
+
+Protocol: every message in either direction is a frame made of a one byte type, a four byte big-endian length and a payload. Type b'J' frames carry a JSON object, type b'D' frames carry raw stream data.
+
+Requests (all fields but "op" are optional, "id" is echoed back):
+
+    {"id": 1, "op": "encipher", "key": "TDS", "rotors": ["II", "I", "III"], "plugs": ["JS", "HY"], "text": "..."}
+        ("rings" such as "AAA" and "reflector" such as "C" may be added; a fourth rotor, Beta or Gamma, makes a four-rotor machine)
+    {"id": 2, "op": "decipher", ...same fields...}
+    {"id": 3, "op": "stream", "key": ..., "rotors": ..., "plugs": ..., "non_letters": "drop"}
+        followed by any number of b'D' frames and an empty b'D' frame to finish.
+
+Responses come back in request order: {"id": 1, "text": "..."} or {"id": 1, "error": "..."}. A stream is answered with one b'D' frame per input frame and then {"id": 3, "letters": n}.
+
+Requests may be pipelined: a client can send many before reading any answers. Each connection keeps at most pipeline_depth requests in flight, after which the server stops reading from it, so a fast sender cannot make the server buffer without limit. Messages and stream chunks longer than offload_threshold bytes are enciphered in a process pool so the event loop stays responsive; since the machine state after n letters can be computed directly (compiled.advance_offsets), stream chunks do not need to wait for each other.
+
+Machines come from a compiled.SettingsCache, so every request gets a fresh machine reset to its window key while the lookup tables for a setting are built once and reused.
+"""
+# Import helpful tools
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import asyncio
+import json
+import struct
+
+# Import enigma stuff
+from compiled import SETTINGS_CACHE, NON_LETTERS, make_settings, normalize_message
+from wheels import REGISTRY
+
+FRAME_HEADER = struct.Struct('>cI')
+JSON_FRAME = b'J'
+DATA_FRAME = b'D'
+
+def settings_from_request(request):
+    '''
+    Builds MachineSettings from the key, rotors, plugs, rings and reflector fields of a request.
+    '''
+    key = request.get('key', 'AAA')
+    rotors = request.get('rotors', ['I', 'II', 'III'])
+    rings = request.get('rings')
+    reflector = request.get('reflector')
+    if not isinstance(rotors, list) or not all(isinstance(rotor, str) for rotor in rotors) or not REGISTRY.valid_order(rotors):
+        raise ValueError('Please provide three rotors from ' + ', '.join(REGISTRY.rotors) + ', such as ["I", "II", "III"], '
+                         'optionally followed by one of ' + ', '.join(REGISTRY.greek) + '.')
+    if not isinstance(key, str) or len(key) != len(rotors) or normalize_message(key) is None:
+        raise ValueError('Please provide a position key with one letter per rotor, such as AAA.')
+    if rings is not None and (not isinstance(rings, str) or len(rings) != len(rotors) or normalize_message(rings) is None):
+        raise ValueError('Please provide ring settings with one letter per rotor, such as AAA.')
+    if reflector is not None and reflector not in REGISTRY.reflectors:
+        raise ValueError('Please provide a reflector from ' + ', '.join(REGISTRY.reflectors) + '.')
+    return make_settings(key, request.get('plugs'), rotors, rings, reflector)
+
+def encipher_text(settings, text):
+    '''
+    Enciphers a whole message. Runs in the event loop or in a worker process.
+    '''
+    codes = normalize_message(text)
+    if codes is None:
+        raise ValueError('Please provide a string containing only the characters a-zA-Z and spaces.')
+    return SETTINGS_CACHE.get(settings).encipher_codes(codes).decode('ascii')
+
+def encipher_stream_chunk(settings, position, chunk, non_letters):
+    '''
+    Enciphers one stream chunk that starts position letters into the stream. Runs in the event loop or in a worker process.
+    '''
+    machine = SETTINGS_CACHE.get(settings)
+    machine.advance(position)
+    return machine.encipher_chunk(chunk, non_letters)
+
+class FrameTooLarge(Exception):
+    pass
+
+async def read_frame(reader, max_size):
+    '''
+    Reads one (type, payload) frame. Raises asyncio.IncompleteReadError at end of input.
+    '''
+    kind, length = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    if length > max_size:
+        raise FrameTooLarge('Frame of ' + str(length) + ' bytes is larger than the limit of ' + str(max_size) + '.')
+    return kind, await reader.readexactly(length)
+
+def write_frame(writer, kind, payload):
+    writer.write(FRAME_HEADER.pack(kind, len(payload)))
+    writer.write(payload)
+
+def write_json(writer, message):
+    write_frame(writer, JSON_FRAME, json.dumps(message).encode('utf-8'))
+
+class StreamResponse():
+    '''
+    Slot in a connection's response queue for a stream: the enciphered chunks in order, then a summary.
+    '''
+
+    def __init__(self, request_id, max_chunks):
+        self.id = request_id
+        self.chunks = asyncio.Queue(max_chunks)
+        self.letters = 0
+        self.error = None
+
+def _done(response):
+    future = asyncio.get_running_loop().create_future()
+    future.set_result(response)
+    return future
+
+async def put_or_give_up(queue, item, sender):
+    '''
+    Puts item on a bounded queue, unless sender (the task emptying it) finishes first. Returns whether the item went in.
+    '''
+    if not queue.full():
+        queue.put_nowait(item)
+        return True
+    put = asyncio.ensure_future(queue.put(item))
+    await asyncio.wait([put, sender], return_when=asyncio.FIRST_COMPLETED)
+    if not put.done():
+        put.cancel()
+        return False
+    return True
+
+def cancel_pending(responses):
+    '''
+    Cancels the encipher tasks still waiting in a connection's response queue (and in any stream in it).
+    '''
+    while not responses.empty():
+        item = responses.get_nowait()
+        if isinstance(item, StreamResponse):
+            cancel_pending(item.chunks)
+        elif item is not None:
+            item.cancel()
+
+class EnigmaServer():
+    '''
+    asyncio Enigma service. Use start_tcp or start_unix inside a running event loop, or serve() from main.
+
+    workers = size of the process pool for long messages (0 never offloads).
+    offload_threshold = messages or stream chunks longer than this many bytes go to the pool.
+    max_frame = largest frame accepted, in bytes.
+    pipeline_depth = requests (or stream chunks) a connection may have in flight before the server stops reading from it.
+    '''
+
+    def __init__(self, workers=None, offload_threshold=1 << 16, max_frame=1 << 24, pipeline_depth=32):
+        self.workers = workers
+        self.offload_threshold = offload_threshold
+        self.max_frame = max_frame
+        self.pipeline_depth = pipeline_depth
+        self.executor = None
+        self.servers = []
+        # Open connections, so close() can hang up on them and wait for their handlers to finish.
+        self.connections = {}
+
+    def _start_executor(self):
+        if self.executor is None and self.workers != 0:
+            self.executor = ProcessPoolExecutor(self.workers)
+
+    async def start_tcp(self, host='127.0.0.1', port=0):
+        '''
+        Listens on a TCP port (0 picks a free one) and returns the asyncio server.
+        '''
+        self._start_executor()
+        server = await asyncio.start_server(self.handle, host, port)
+        self.servers.append(server)
+        return server
+
+    async def start_unix(self, path):
+        '''
+        Listens on a Unix socket and returns the asyncio server.
+        '''
+        self._start_executor()
+        server = await asyncio.start_unix_server(self.handle, path)
+        self.servers.append(server)
+        return server
+
+    async def close(self):
+        '''
+        Stops listening, closes open connections and shuts down the worker pool.
+        '''
+        for server in self.servers:
+            server.close()
+        for writer in self.connections.values():
+            writer.close()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        for server in self.servers:
+            await server.wait_closed()
+        self.servers = []
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    async def run(self, offload, func, *args):
+        '''
+        Runs func in the worker pool if offload is set (and there is a pool), otherwise right here.
+        '''
+        if offload and self.executor is not None:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        return func(*args)
+
+    async def encipher(self, request):
+        '''
+        Handles an encipher or decipher request and returns the response.
+        '''
+        try:
+            settings = settings_from_request(request)
+            text = request.get('text', '')
+            if not isinstance(text, str):
+                raise ValueError('text must be a string.')
+            cipher = await self.run(len(text) > self.offload_threshold, encipher_text, settings, text)
+            return {'id': request.get('id'), 'text': cipher}
+        except Exception as error:
+            return {'id': request.get('id'), 'error': str(error)}
+
+    async def handle(self, reader, writer):
+        '''
+        Serves one connection: reads requests, queues their responses in order and lets _send write them out.
+        '''
+        handler = asyncio.current_task()
+        self.connections[handler] = writer
+        responses = asyncio.Queue(self.pipeline_depth)
+        sender = asyncio.ensure_future(self._send(responses, writer))
+        # Set when the client goes away partway through a request, so there is nobody left to answer.
+        hung_up = False
+        in_stream = False
+        try:
+            while not sender.done():
+                kind, payload = await read_frame(reader, self.max_frame)
+                try:
+                    request = json.loads(payload.decode('utf-8'))
+                    if kind != JSON_FRAME or not isinstance(request, dict):
+                        raise ValueError
+                except ValueError:
+                    await put_or_give_up(responses, _done({'id': None, 'error': 'Expected a JSON request frame.'}), sender)
+                    continue
+                op = request.get('op')
+                if op in ('encipher', 'decipher'):
+                    # Queuing blocks once pipeline_depth requests are waiting, which stops reading from this client.
+                    await put_or_give_up(responses, asyncio.ensure_future(self.encipher(request)), sender)
+                elif op == 'stream':
+                    in_stream = True
+                    await self._receive_stream(request, reader, responses, sender)
+                    in_stream = False
+                else:
+                    await put_or_give_up(responses, _done({'id': request.get('id'), 'error': 'Unknown op ' + repr(op) + '.'}),
+                                         sender)
+        except asyncio.IncompleteReadError as error:
+            # End of input between requests is a normal close, and the answers still go out; anywhere else the client hung up.
+            hung_up = in_stream or len(error.partial) > 0
+        except FrameTooLarge as error:
+            # The rest of the input cannot be trusted, so answer and hang up.
+            await put_or_give_up(responses, _done({'id': None, 'error': str(error)}), sender)
+        except (ConnectionError, asyncio.CancelledError):
+            hung_up = True
+            raise
+        finally:
+            if not hung_up:
+                await put_or_give_up(responses, None, sender)
+            else:
+                sender.cancel()
+            try:
+                await sender
+            except (ConnectionError, asyncio.CancelledError):
+                pass
+            cancel_pending(responses)
+            writer.close()
+            del self.connections[handler]
+
+    async def _receive_stream(self, request, reader, responses, sender):
+        '''
+        Reads the data frames of a stream request, starting one encipher task per chunk.
+
+        The stream's queue is always closed with None, even when the client hangs up or sends a bad frame halfway through, so _send never waits on it forever.
+        '''
+        stream = StreamResponse(request.get('id'), self.pipeline_depth)
+        await put_or_give_up(responses, stream, sender)
+        non_letters = request.get('non_letters', 'drop')
+        try:
+            settings = settings_from_request(request)
+            if non_letters not in ('drop', 'pass', 'error'):
+                raise ValueError('non_letters must be one of drop, pass, error.')
+        except Exception as error:
+            stream.error = str(error)
+        position = 0
+        try:
+            while True:
+                kind, payload = await read_frame(reader, self.max_frame)
+                if kind != DATA_FRAME:
+                    stream.error = stream.error or 'Expected a data frame inside a stream.'
+                    break
+                if not payload:
+                    break
+                if stream.error is None:
+                    task = asyncio.ensure_future(self.run(len(payload) > self.offload_threshold, encipher_stream_chunk,
+                                                          settings, position, payload, non_letters))
+                    await put_or_give_up(stream.chunks, task, sender)
+                    # Every letter moves the rotors once, so the next chunk's starting point is known straight away.
+                    position += len(payload.upper().translate(None, NON_LETTERS))
+        except asyncio.IncompleteReadError:
+            stream.error = stream.error or 'Connection closed inside a stream.'
+            raise
+        except FrameTooLarge as error:
+            stream.error = stream.error or str(error)
+            raise
+        finally:
+            stream.letters = position
+            await put_or_give_up(stream.chunks, None, sender)
+
+    async def _send(self, responses, writer):
+        '''
+        Writes responses in request order, waiting for the socket to drain after each one.
+        '''
+        while True:
+            item = await responses.get()
+            if item is None:
+                break
+            if isinstance(item, StreamResponse):
+                while True:
+                    task = await item.chunks.get()
+                    if task is None:
+                        break
+                    try:
+                        output = await task
+                    except Exception as error:
+                        item.error = item.error or str(error)
+                        continue
+                    if item.error is None:
+                        write_frame(writer, DATA_FRAME, output)
+                        await writer.drain()
+                if item.error is None:
+                    write_json(writer, {'id': item.id, 'letters': item.letters})
+                else:
+                    write_json(writer, {'id': item.id, 'error': item.error})
+            else:
+                write_json(writer, await item)
+            await writer.drain()
+
+class EnigmaClient():
+    '''
+    Small client for EnigmaServer, mainly for tests and scripts.
+    '''
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.next_id = 0
+
+    @classmethod
+    async def connect(cls, host='127.0.0.1', port=0):
+        return cls(*await asyncio.open_connection(host, port))
+
+    @classmethod
+    async def connect_unix(cls, path):
+        return cls(*await asyncio.open_unix_connection(path))
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+    def send(self, op, **fields):
+        '''
+        Queues a request without waiting for its answer (so several can be pipelined). Returns its id.
+        '''
+        self.next_id += 1
+        write_json(self.writer, dict(fields, id=self.next_id, op=op))
+        return self.next_id
+
+    async def receive(self):
+        '''
+        Reads the next JSON response.
+        '''
+        kind, payload = await read_frame(self.reader, 1 << 31)
+        return json.loads(payload.decode('utf-8'))
+
+    async def request(self, op, **fields):
+        self.send(op, **fields)
+        await self.writer.drain()
+        return await self.receive()
+
+    async def encipher(self, text, key='AAA', rotors=['I', 'II', 'III'], plugs=None):
+        response = await self.request('encipher', text=text, key=key, rotors=rotors, plugs=plugs)
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return response['text']
+
+    async def decipher(self, text, key='AAA', rotors=['I', 'II', 'III'], plugs=None):
+        return await self.encipher(text, key, rotors, plugs)
+
+    async def stream(self, chunks, key='AAA', rotors=['I', 'II', 'III'], plugs=None, non_letters='drop'):
+        '''
+        Sends an iterable of byte chunks as a stream and returns the enciphered bytes.
+        Output is read while input is still being sent, so a large stream cannot deadlock on full socket buffers.
+        '''
+        async def read_output():
+            output = []
+            while True:
+                kind, payload = await read_frame(self.reader, 1 << 31)
+                if kind == JSON_FRAME:
+                    response = json.loads(payload.decode('utf-8'))
+                    if 'error' in response:
+                        raise ValueError(response['error'])
+                    return b''.join(output)
+                output.append(payload)
+        reading = asyncio.ensure_future(read_output())
+        self.send('stream', key=key, rotors=rotors, plugs=plugs, non_letters=non_letters)
+        for chunk in chunks:
+            if chunk:
+                write_frame(self.writer, DATA_FRAME, chunk)
+                await self.writer.drain()
+        write_frame(self.writer, DATA_FRAME, b'')
+        await self.writer.drain()
+        return await reading
+
+async def serve(host='127.0.0.1', port=8726, unix=None, workers=None):
+    '''
+    Runs a server until cancelled.
+    '''
+    server = EnigmaServer(workers)
+    listener = await (server.start_unix(unix) if unix else server.start_tcp(host, port))
+    print('Enigma server listening on ' + (unix or '%s:%d' % listener.sockets[0].getsockname()[:2]))
+    try:
+        await listener.serve_forever()
+    finally:
+        await server.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m server', description='Run the asyncio Enigma service.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8726)
+    parser.add_argument('--unix', help='listen on this Unix socket path instead of TCP')
+    parser.add_argument('--workers', type=int, help='processes for long messages (default: number of CPUs)')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+#! /usr/bin/python
+"""
+Checks that the bombe finds a known rotor order, start position and plugboard from a crib.
+
+Run with python -m pytest test_bombe.py.
+"""
+# Import helpful tools
+import pytest
+
+# Import enigma stuff
+from machine import Enigma
+from rejewski import msg1
+import bombe
+
+KEY = 'TDS'
+ROTOR_ORDER = ['II', 'I', 'III']
+SWAPS = [('J', 'S'), ('H', 'Y'), ('N', 'F')]
+PLAIN = msg1.upper().replace(' ', '')
+CIPHER = Enigma(KEY, SWAPS, ROTOR_ORDER).encipher(PLAIN)
+
+def test_crib_search_finds_setting():
+    stops = bombe.crib_search(CIPHER, PLAIN[:17], 0, ['I', 'II', 'III'], workers=1)
+    # The menu does not reach J or S, so only the other two pairs are found.
+    assert stops == [(0, ROTOR_ORDER, KEY, ['FN', 'HY'])]
+
+def test_crib_search_stops_early(monkeypatch):
+    searched = []
+    search_task = bombe._search_task
+    def counted(task):
+        searched.append(task[0])
+        return search_task(task)
+    monkeypatch.setattr(bombe, '_search_task', counted)
+    assert bombe.crib_search(CIPHER, PLAIN[:17], 0, ['I', 'II', 'III'], workers=1, max_stops=1) == \
+        [(0, ROTOR_ORDER, KEY, ['FN', 'HY'])]
+    # The stop is in the third rotor order, so the last three are never searched.
+    assert searched == [['I', 'II', 'III'], ['I', 'III', 'II'], ROTOR_ORDER]
+
+def test_crib_search_rejects_loopless_menu():
+    crib = 'HSRELTP'
+    assert all(bombe.menu_loop_count(bombe.make_menu(crib, CIPHER, offset)) == 0
+               for offset in bombe.possible_offsets(crib, CIPHER))
+    with pytest.raises(ValueError):
+        bombe.crib_search(CIPHER, crib, None, ['I', 'II', 'III'], workers=1)
@@ -0,0 +1,20 @@
+#! /usr/bin/python
+"""
+Checks that candidates.rank_candidates finds the message key through the indicator and ranks the true day key first.
+"""
+# Import enigma stuff
+from machine import Enigma
+import candidates
+import rejewski
+
+def test_true_day_key_ranks_first():
+    swaps, order = rejewski.SECRET_SWAPS, rejewski.SECRET_ROTOR_ORDER
+    # The day key only enciphers the doubled message key; the messages are sent at the message key.
+    indicator = Enigma(rejewski.SECRET_DAY_KEY, swaps, order).encipher('TDSTDS')
+    ciphertexts = [Enigma('TDS', swaps, order).encipher(message) for message in (rejewski.msg1, rejewski.msg2, rejewski.msg3)]
+    ranked = candidates.rank_candidates([(tuple('AAC'), tuple(order)), (tuple('YAQ'), tuple(order))], indicator, ciphertexts,
+                                        swaps, workers=1)
+    score, key, found_order, message_key, plaintexts = ranked[0]
+    assert (key, found_order, message_key) == ('YAQ', order, 'TDS')
+    assert plaintexts[1] == rejewski.msg2.upper().replace(' ', '')
+    assert score > 0.06 > ranked[1][0]
@@ -0,0 +1,26 @@
+#! /usr/bin/python
+"""
+Checks that a chain catalog file reads back exactly like the chains dictionary it was written from.
+
+Run with python -m pytest test_catalog.py.
+"""
+# Import enigma stuff
+from catalog import write_catalog, ChainCatalog
+
+CHAINS = {
+    'AD:6677 BE:11221010 CF:221111': [(('A', 'B', 'C'), ('I', 'II', 'III')), (('Z', 'Z', 'Z'), ('VIII', 'VII', 'VI'))],
+    'AD:1313 BE:6677 CF:1313': [(('Q', 'E', 'V'), ('II', 'I', 'III'))],
+}
+
+def test_catalog_round_trip(tmp_path):
+    path = str(tmp_path/'chains.catalog')
+    write_catalog(CHAINS, path)
+    with ChainCatalog(path) as catalog:
+        assert len(catalog) == len(CHAINS)
+        assert dict(catalog.items()) == CHAINS
+        for index, candidates in CHAINS.items():
+            assert index in catalog
+            assert catalog[index] == candidates
+        assert 'AD:6677 BE:6677 CF:6677' not in catalog
+        assert 'x' not in catalog
+        assert catalog.get('x') is None
@@ -0,0 +1,33 @@
+#! /usr/bin/python
+"""
+Checks the ciphertext-only attack: its sweep tables agree with machine.Enigma, and the whole search recovers a known setting.
+
+Run with python -m pytest test_ciphertext_only.py.
+"""
+# Import enigma stuff
+from machine import Enigma
+from components import ALPHABET
+from rejewski import msg1, msg2, msg3
+import batch
+import ciphertext_only
+
+KEY = 'TDS'
+ROTOR_ORDER = ['II', 'I', 'III']
+SWAPS = [('J', 'S'), ('H', 'Y'), ('N', 'F')]
+
+def test_order_tables_match_machine():
+    scrambler, successor = batch.order_tables(ROTOR_ORDER)
+    for key in ('AAA', 'TDS', 'QEV', 'ZZZ'):
+        state = sum(ALPHABET.index(letter)*26**(2 - i) for i, letter in enumerate(key))
+        enigma = Enigma(key, None, ROTOR_ORDER)
+        for letter in 'ENIGMA':
+            state = successor[state]
+            assert ALPHABET[scrambler[state, ALPHABET.index(letter)]] == enigma.encipher(letter)
+
+def test_search_recovers_setting():
+    ciphertexts = [Enigma(KEY, SWAPS, ROTOR_ORDER).encipher(message) for message in (msg1, msg2, msg3)]
+    assert ciphertext_only.sweep(ciphertexts, ['I', 'II', 'III'], top=1, workers=1)[0][1:] == (KEY, ROTOR_ORDER)
+    fitness, key, order, swaps, plaintexts = ciphertext_only.ciphertext_only_search(
+        ciphertexts, ['I', 'II', 'III'], top=5, refine_top=2, workers=1)[0]
+    assert (key, order, swaps) == (KEY, ROTOR_ORDER, ['FN', 'HY', 'JS'])
+    assert plaintexts == [message.upper().replace(' ', '') for message in (msg1, msg2, msg3)]
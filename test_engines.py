@@ -0,0 +1,140 @@
+#! /usr/bin/python
+"""
+Checks that every fast path enciphers exactly like the letter by letter machine.Enigma: compiled tables, cached settings, batch arrays, seeking and parallel chunks, streams and caller-supplied buffers.
+
+Run with python -m pytest test_engines.py.
+"""
+# Import helpful tools
+import random
+
+import pytest
+
+# Import enigma stuff
+from machine import Enigma
+from compiled import CompiledEnigma, SettingsCache, encipher_at, encipher_parallel
+from components import ALPHABET, ROTOR_WIRINGS
+from wheels import REGISTRY
+import batch
+
+def random_settings(count, seed, rings=True, four=True):
+    '''
+    Returns count random (key, swaps, rotor order, rings, reflector, message) tuples. Rotors VI - VIII (two notches) and long enough messages make the middle and right rotors carry.
+    '''
+    rng = random.Random(seed)
+    settings = []
+    for i in range(count):
+        order = rng.sample(list(ROTOR_WIRINGS), 3)
+        if four and i%4 == 0:
+            order.append(rng.choice(list(REGISTRY.greek)))
+            reflector = rng.choice(['B-thin', 'C-thin'])
+        else:
+            reflector = rng.choice(['A', 'B', 'C']) if rings else 'B'
+        key = ''.join(rng.choice(ALPHABET) for rotor in order)
+        ring_letters = ''.join(rng.choice(ALPHABET) for rotor in order) if rings else 'A'*len(order)
+        letters = rng.sample(ALPHABET, 2*rng.randint(0, 10))
+        swaps = [(letters[j], letters[j + 1]) for j in range(0, len(letters), 2)]
+        message = ''.join(rng.choice(ALPHABET + ' ') for j in range(rng.randint(1, 700)))
+        settings.append((key, swaps, order, ring_letters, reflector, message))
+    return settings
+
+def reference(key, swaps, order, rings, reflector, message):
+    '''
+    Ciphertext and final windows from the letter by letter machine.
+    '''
+    enigma = Enigma(key, swaps, order, rings=rings, reflector=reflector)
+    cipher = enigma.encipher(message)
+    return cipher, windows(enigma)
+
+def windows(enigma):
+    rotors = [enigma.l_rotor, enigma.m_rotor, enigma.r_rotor] + ([enigma.greek_rotor] if enigma.greek_rotor else [])
+    return ''.join(rotor.window for rotor in rotors)
+
+@pytest.mark.parametrize('setting', random_settings(40, 1))
+def test_compiled_matches_legacy(setting):
+    key, swaps, order, rings, reflector, message = setting
+    cipher, final = reference(*setting)
+    enigma = Enigma(key, swaps, order, compiled=True, rings=rings, reflector=reflector)
+    assert enigma.encipher(message) == cipher
+    assert windows(enigma) == final
+    engine = CompiledEnigma(key, swaps, order, rings, reflector)
+    assert engine.encipher(message) == cipher
+    assert engine.window() == final
+
+@pytest.mark.parametrize('setting', random_settings(10, 2))
+def test_compiled_keeps_state_between_calls(setting):
+    key, swaps, order, rings, reflector, message = setting
+    cipher, final = reference(*setting)
+    enigma = Enigma(key, swaps, order, compiled=True, rings=rings, reflector=reflector)
+    half = len(message)//2
+    assert enigma.encipher(message[:half]) + enigma.encipher(message[half:]) == cipher
+    assert windows(enigma) == final
+
+def test_settings_cache_hits_and_misses():
+    cache = SettingsCache(capacity=2)
+    swaps = [('A', 'B'), ('C', 'D')]
+    first = cache.machine('AAA', swaps, ['I', 'II', 'III'])
+    # Another window key, or the same plugboard written differently, shares the entry.
+    second = cache.machine('QEV', [('d', 'c'), ('B', 'A')], ['I', 'II', 'III'])
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'size': 1, 'capacity': 2}
+    assert first.window() == 'AAA' and second.window() == 'QEV'
+    assert first.encipher('HELLOWORLD') == Enigma('AAA', swaps).encipher('HELLOWORLD')
+    assert second.encipher('HELLOWORLD') == Enigma('QEV', swaps).encipher('HELLOWORLD')
+    # Machines handed out keep their own positions.
+    assert cache.machine('AAA', swaps, ['I', 'II', 'III']).window() == 'AAA'
+    # Ring settings, reflector and rotor order all change the tables.
+    cache.machine('AAA', swaps, ['I', 'II', 'III'], rings='BAA')
+    cache.machine('AAA', swaps, ['I', 'II', 'III'], reflector='C')
+    assert cache.stats() == {'hits': 2, 'misses': 3, 'size': 2, 'capacity': 2}
+    # The least recently used entry (rings AAA, reflector B) was evicted.
+    cache.machine('AAA', swaps, ['I', 'II', 'III'])
+    assert cache.stats()['misses'] == 4
+
+def test_batch_matches_legacy():
+    # batch.py takes ring settings to be A and the reflector to be B.
+    settings = random_settings(40, 3, rings=False, four=False)
+    keys, swaps, orders, rings, reflectors, messages = zip(*settings)
+    assert batch.encipher_batch(list(keys), list(orders), list(messages), list(swaps)) == \
+        [reference(*setting)[0] for setting in settings]
+
+@pytest.mark.parametrize('setting', random_settings(10, 4))
+def test_seek_and_parallel_match_legacy(setting):
+    key, swaps, order, rings, reflector, message = setting
+    cipher = reference(*setting)[0]
+    letters = message.replace(' ', '')
+    for start in (0, 1, len(letters)//3, len(letters) - 1):
+        assert encipher_at(letters[start:], start, key, swaps, order, rings, reflector) == cipher[start:]
+    assert encipher_parallel(message, key, swaps, order, 2, 97, rings, reflector) == cipher
+
+@pytest.mark.parametrize('setting', random_settings(10, 5))
+def test_stream_matches_legacy(setting):
+    key, swaps, order, rings, reflector, message = setting
+    cipher, final = reference(*setting)
+    data = message.encode('ascii')
+    chunks = [data[i:i + 53] for i in range(0, len(data), 53)]
+    enigma = Enigma(key, swaps, order, rings=rings, reflector=reflector)
+    assert b''.join(enigma.encipher_stream(chunks)).decode('ascii') == cipher
+    assert windows(enigma) == final
+
+@pytest.mark.parametrize('setting', random_settings(10, 6))
+def test_encipher_into_matches_legacy(setting):
+    key, swaps, order, rings, reflector, message = setting
+    cipher, final = reference(*setting)
+    enigma = Enigma(key, swaps, order, rings=rings, reflector=reflector)
+    out = bytearray(len(message))
+    count = enigma.encipher_into(message.lower().encode('ascii'), out)
+    assert out[:count].decode('ascii') == cipher
+    assert windows(enigma) == final
+
+@pytest.mark.parametrize('setting', random_settings(10, 7))
+def test_advance_matches_stepping(setting):
+    key, swaps, order, rings, reflector, message = setting
+    final = reference(*setting)[1]
+    enigma = Enigma(key, swaps, order, rings=rings, reflector=reflector)
+    enigma.advance(len(message.replace(' ', '')))
+    assert windows(enigma) == final
+
+def test_lowercase_swaps_match_uppercase():
+    cipher = Enigma('AAA', [('A', 'B')]).encipher('ABABAB')
+    assert Enigma('AAA', [('a', 'b')]).encipher('ABABAB') == cipher
+    assert CompiledEnigma('AAA', [('a', 'B')]).encipher('ABABAB') == cipher
+    assert batch.encipher_batch(['AAA'], [['I', 'II', 'III']], ['ABABAB'], [[('a', 'b')]]) == [cipher]
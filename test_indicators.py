@@ -0,0 +1,80 @@
+#! /usr/bin/python
+"""
+Checks that IndicatorCollector narrows the catalog down to the day key as indicators arrive, and that CatalogQuery's bitsets give the same answer as checking every index.
+
+Run with python -m pytest test_indicators.py.
+"""
+# Import helpful tools
+from itertools import permutations
+import random
+
+import pytest
+
+# Import enigma stuff
+from machine import Enigma
+from components import ALPHABET
+from catalog import write_catalog, split_index, ChainCatalog
+from indicators import IndicatorCollector, CatalogQuery, cycle_structure, permutation_array, signature_compatible
+import batch
+import rejewski
+
+DAY_KEY = 'YAQ'
+ROTOR_ORDER = ('II', 'I', 'III')
+SWAPS = [('J', 'S'), ('H', 'Y'), ('N', 'F')]
+
+@pytest.fixture(scope='module')
+def chains():
+    '''
+    A small chains dictionary: every day key starting with Y under the six orders of rotors I - III.
+    '''
+    settings = [(('Y', second, third), order) for second in ALPHABET for third in ALPHABET
+                for order in permutations(['I', 'II', 'III'])]
+    indices = rejewski.chain_indices(batch.key_offsets([''.join(key) for key, order in settings]),
+                                     batch.order_ids([order for key, order in settings]))
+    chains = {}
+    for index, setting in zip(indices, settings):
+        chains.setdefault(index, []).append(setting)
+    return chains
+
+def make_indicators(count, seed):
+    rng = random.Random(seed)
+    enigma = Enigma(DAY_KEY, SWAPS, list(ROTOR_ORDER))
+    indicators = []
+    for i in range(count):
+        msg_key = ''.join(rng.choice(ALPHABET) for j in range(3))
+        enigma.set_rotor_position(DAY_KEY)
+        indicators.append(enigma.encipher(msg_key + msg_key))
+    return indicators
+
+def test_collector_narrows_to_day_key(chains, tmp_path):
+    path = str(tmp_path/'chains.catalog')
+    write_catalog(chains, path)
+    indicators = make_indicators(150, 1)
+    with ChainCatalog(path) as catalog:
+        for source in (chains, catalog):
+            collector = IndicatorCollector(source)
+            counts = list(collector.add_many(indicators))
+            assert counts == sorted(counts, reverse=True)
+            assert counts[-1] < counts[0]
+            assert collector.complete() and collector.conflicts == 0
+            # Once AD, BE and CF are complete only the day key's own index is left.
+            assert collector.consistent_indices() == [rejewski.generate_chain_index(
+                rejewski.make_chains_from_permutation_dict(collector.permutation_dicts()))]
+            assert (tuple(DAY_KEY), ROTOR_ORDER) in collector.candidates()
+            assert collector.candidate_count() == counts[-1] == len(collector.candidates())
+
+def test_catalog_query_matches_scan(chains):
+    query = CatalogQuery(chains)
+    permutation_dicts = rejewski.generate_permutation_dicts(make_indicators(12, 2))
+    assert any(b is None for perm in permutation_dicts for b in perm.values())
+    structures = [cycle_structure(permutation_array(perm)) for perm in permutation_dicts]
+    expected = [index for index in chains
+                if all(signature_compatible(sig, *structure) for sig, structure in zip(split_index(index), structures))]
+    assert sorted(query.indices(permutation_dicts)) == sorted(expected)
+    assert query.indices(structures) == query.indices(permutation_dicts)
+    assert (tuple(DAY_KEY), ROTOR_ORDER) in query.query(permutation_dicts)
+
+def test_catalog_query_rejects_non_permutation(chains):
+    permutation_dicts = [{'A': 'C', 'B': 'C'}, {}, {}]
+    with pytest.raises(ValueError):
+        CatalogQuery(chains).mask(permutation_dicts)
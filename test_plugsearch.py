@@ -0,0 +1,23 @@
+#! /usr/bin/python
+"""
+Checks that plugsearch.solve_plugboard recovers a known plugboard once the rotor order and position are known.
+
+Run with python -m pytest test_plugsearch.py.
+"""
+# Import enigma stuff
+from machine import Enigma
+from plugsearch import solve_plugboard
+from rejewski import msg1, msg2, msg3
+
+KEY = 'TDS'
+ROTOR_ORDER = ['II', 'I', 'III']
+SWAPS = [('J', 'S'), ('H', 'Y'), ('N', 'F'), ('A', 'W'), ('C', 'G'), ('K', 'R')]
+
+def test_solve_plugboard_recovers_swaps():
+    ciphertexts = [Enigma(KEY, SWAPS, ROTOR_ORDER).encipher(message) for message in (msg1, msg2, msg3)]
+    # A single hill climb can settle on a near miss such as JR KS for JS KR, so it gets a few restarts.
+    for method, restarts in (('hill', 8), ('anneal', 1)):
+        plugboard, score = solve_plugboard(ciphertexts, KEY, ROTOR_ORDER, restarts=restarts, workers=1, method=method,
+                                           iterations=5000)
+        assert plugboard.swaps == Enigma(KEY, SWAPS, ROTOR_ORDER).plugboard.swaps
+        assert Enigma(KEY, list(plugboard.swaps.items()), ROTOR_ORDER).decipher(ciphertexts[0]) == msg1.upper().replace(' ', '')
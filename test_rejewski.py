@@ -0,0 +1,67 @@
+#! /usr/bin/python
+"""
+Checks that the vectorized chain indices and the parallel chain dictionary builder agree with the original letter by letter attack in rejewski.py.
+
+Run with python -m pytest test_rejewski.py.
+"""
+# Import helpful tools
+import json
+import os
+import pickle
+
+# Import enigma stuff
+from machine import Enigma
+from components import ALPHABET
+import batch
+import rejewski
+
+def chain_index(day_key, rotor_order):
+    '''
+    The chain index found the original way, from message keys enciphered twice at the day key. Enciphering each of AAA, BBB, ... ZZZ fills the AD, BE and CF dictionaries completely.
+    '''
+    enigma = Enigma(day_key, None, rotor_order)
+    encrypts = []
+    for letter in ALPHABET:
+        enigma.set_rotor_position(day_key)
+        encrypts.append(enigma.encipher(letter*6))
+    return rejewski.generate_chain_index(rejewski.make_chains_from_permutation_dict(rejewski.generate_permutation_dicts(encrypts)))
+
+def test_chain_indices_match_generate_chain_index():
+    settings = [('YAQ', ['II', 'I', 'III']), ('AAA', ['I', 'II', 'III']), ('QEV', ['VIII', 'V', 'VI']), ('ZZZ', ['VII', 'IV', 'II'])]
+    indices = rejewski.chain_indices(batch.key_offsets([key for key, order in settings]),
+                                     batch.order_ids([order for key, order in settings]))
+    assert indices == [chain_index(key, order) for key, order in settings]
+
+def write_parts(parts_dir, rotors, first_letters):
+    '''
+    Leaves part files behind as an interrupted run would, each holding one made-up index for its first letter.
+    '''
+    os.makedirs(parts_dir)
+    json.dump(rotors, open(os.path.join(parts_dir, 'rotors.json'), 'w'))
+    for first_letter in first_letters:
+        setting = ((ALPHABET[first_letter], 'A', 'A'), tuple(rotors))
+        pickle.dump([('AD:1 BE:1 CF:1', setting)], open(os.path.join(parts_dir, 'part-%02d.pickle' % first_letter), 'wb'))
+
+def test_make_chain_length_dict_resumes(tmp_path):
+    output = str(tmp_path/'chains.pickle')
+    rotors = ['I', 'II', 'III']
+    # Every part but the one for day keys starting with Y is already done.
+    write_parts(output + '.parts', rotors, [i for i in range(26) if i != ALPHABET.index('Y')])
+    chains_dict = rejewski.make_chain_length_dict(workers=1, output=output, rotors=rotors)
+    assert len(chains_dict['AD:1 BE:1 CF:1']) == 25
+    assert sum(len(candidates) for candidates in chains_dict.values()) == 25 + 26*26*6
+    assert (('Y', 'A', 'Q'), ('II', 'I', 'III')) in chains_dict[chain_index('YAQ', ['II', 'I', 'III'])]
+    assert pickle.load(open(output, 'rb')) == chains_dict
+    assert not os.path.exists(output + '.parts')
+
+def test_make_chain_length_dict_discards_other_rotors(tmp_path, monkeypatch):
+    output = str(tmp_path/'chains.pickle')
+    write_parts(output + '.parts', ['IV', 'V', 'VI'], range(26))
+    built = []
+    def build_chain_chunk(first_letter, rotors, parts_dir):
+        built.append(first_letter)
+        pickle.dump([], open(os.path.join(parts_dir, 'part-%02d.pickle' % first_letter), 'wb'))
+        return first_letter
+    monkeypatch.setattr(rejewski, 'build_chain_chunk', build_chain_chunk)
+    assert rejewski.make_chain_length_dict(workers=1, output=output, rotors=['I', 'II', 'III']) == {}
+    assert built == list(range(26))
@@ -0,0 +1,68 @@
+#! /usr/bin/python
+"""
+Checks the asyncio Enigma service end to end over a local TCP socket: pipelined requests come back in order and match machine.Enigma, streams match Enigma.encipher_stream, and a client hanging up inside a stream does not leave the connection hanging.
+
+Run with python -m pytest test_server.py.
+"""
+# Import helpful tools
+import asyncio
+
+# Import enigma stuff
+from machine import Enigma
+from server import EnigmaServer, EnigmaClient, write_frame, DATA_FRAME
+
+MESSAGE = 'The future belongs to those who believe in the beauty of their dreams'
+
+def run(test, **options):
+    '''
+    Starts a server, connects a client, runs test(server, client) and shuts everything down.
+    '''
+    async def main():
+        server = EnigmaServer(**options)
+        listener = await server.start_tcp()
+        client = await EnigmaClient.connect(*listener.sockets[0].getsockname()[:2])
+        try:
+            return await asyncio.wait_for(test(server, client), 10)
+        finally:
+            await client.close()
+            await asyncio.wait_for(server.close(), 10)
+    return asyncio.run(main())
+
+def test_pipelined_requests_answer_in_order():
+    keys = ['AAA', 'TDS', 'QEV', 'ZZZ']
+    async def test(server, client):
+        ids = [client.send('encipher', text=MESSAGE, key=key, rotors=['II', 'I', 'III'], plugs=['JS', 'HY']) for key in keys]
+        ids.append(client.send('encipher', text=MESSAGE, rotors=['I', 'IX', 'III']))
+        ids.append(client.send('rotate'))
+        await client.writer.drain()
+        return ids, [await client.receive() for i in ids]
+    ids, responses = run(test, workers=0, pipeline_depth=2)
+    assert [response['id'] for response in responses] == ids
+    for key, response in zip(keys, responses):
+        assert response['text'] == Enigma(key, [('J', 'S'), ('H', 'Y')], ['II', 'I', 'III']).encipher(MESSAGE)
+    assert 'error' in responses[-2] and 'error' in responses[-1]
+
+def test_stream_matches_encipher_stream():
+    data = MESSAGE.encode('ascii')*20
+    chunks = [data[i:i + 100] for i in range(0, len(data), 100)]
+    async def test(server, client):
+        streamed = await client.stream(chunks, key='TDS', rotors=['II', 'I', 'III'], plugs=['JS'], non_letters='pass')
+        # The connection is still usable after the stream.
+        return streamed, await client.encipher(MESSAGE, key='TDS')
+    # A low offload threshold sends the chunks to the worker pool, each seeking to its own start position.
+    streamed, after = run(test, workers=1, offload_threshold=64)
+    enigma = Enigma('TDS', [('J', 'S')], ['II', 'I', 'III'])
+    assert streamed == b''.join(enigma.encipher_stream(chunks, non_letters='pass'))
+    assert after == Enigma('TDS').encipher(MESSAGE)
+
+def test_hang_up_inside_stream():
+    async def test(server, client):
+        client.send('stream', key='AAA')
+        write_frame(client.writer, DATA_FRAME, MESSAGE.encode('ascii'))
+        await client.writer.drain()
+        # Stop sending but keep reading, so nothing the server writes fails.
+        client.writer.write_eof()
+        # The server notices the hang up and drops the connection by itself.
+        while server.connections:
+            await asyncio.sleep(0.01)
+    run(test, workers=0)
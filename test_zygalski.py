@@ -0,0 +1,28 @@
+#! /usr/bin/python
+"""
+Checks that stacking Zygalski sheets recovers a known rotor order and ring setting from a day's indicators.
+
+Run with python -m pytest test_zygalski.py.
+"""
+# Import helpful tools
+import random
+
+# Import enigma stuff
+import zygalski
+
+ROTOR_ORDER = ('II', 'I', 'III')
+RINGS = 'KDM'
+SWAPS = [('J', 'S'), ('H', 'Y'), ('N', 'F'), ('A', 'W'), ('C', 'G'), ('K', 'R')]
+
+def test_sheets_recover_order_and_rings(tmp_path):
+    path = str(tmp_path/'zygalski.sheets')
+    zygalski.write_sheets(path, ['I', 'II', 'III'], workers=1)
+    random.seed(1)
+    indicators = zygalski.make_indicators(list(ROTOR_ORDER), RINGS, SWAPS, 300)
+    assert len(zygalski.females(indicators)) >= 15
+    with zygalski.ZygalskiSheets(path) as sheets:
+        assert len(sheets) == 6
+        assert sheets.query(indicators) == [(ROTOR_ORDER, RINGS)]
+        # With only a few females the true setting is still there, among others.
+        survivors = sheets.query(indicators[:20])
+        assert (ROTOR_ORDER, RINGS) in survivors and len(survivors) > 1
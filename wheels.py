@@ -0,0 +1,126 @@
+#!/usr/bin/python
+
+'''
+Enigma Machine Simulation
+
+Details: This file holds the registry of Enigma wheels. Rotor, Greek wheel and reflector definitions (wiring, turnover notches and an optional default ring setting) are read from wheels.json once at import, and their integer tables are computed there and shared by every Rotor, compiled machine and batch array that uses them.
+
+- Rotors I - VIII are the stepping rotors. VI - VIII have two notches.
+- Greek wheels (Beta, Gamma) only exist on the four-rotor naval machine. They sit between the right rotor and the reflector and never step.
+- Reflectors A, B and C are for three-rotor machines, B-thin and C-thin for four-rotor machines.
+
+Ring settings (Ringstellung) turn the wiring against the lettered ring. The notches are on the ring, so stepping still depends only on the window letter; the wiring is entered at window offset minus ring offset. With every ring at A the machine behaves exactly as before ring settings were added.
+'''
+# Module imports.
+from itertools import permutations
+import json
+import os
+
+ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+WHEEL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'wheels.json')
+
+def shifted_tables(table):
+    '''
+    Given a wiring as a list of 26 output indices, builds the table for each of the 26 wiring shifts.
+    shifted[shift][index] is the output contact for an input contact, counted from the window as in components.Rotor.encode_letter.
+    '''
+    return [[(table[(i + shift)%26] - shift)%26 for i in range(26)] for shift in range(26)]
+
+class Wheel():
+    '''
+    This class holds one wheel definition and its integer tables.
+    '''
+
+    def __init__(self, name, wiring, notches='', ring='A'):
+        self.name = name
+        self.wiring = wiring.upper()
+        if sorted(self.wiring) != list(ALPHABET):
+            raise ValueError('The wiring of ' + name + ' is not a permutation of the alphabet.')
+        self.notch = notches.upper()
+        self.notches = tuple(ALPHABET.index(letter) for letter in self.notch)
+        self.ring = ALPHABET.index(ring.upper())
+        self.forward = [ALPHABET.index(letter) for letter in self.wiring]
+        self.backward = [0]*26
+        for i, output in enumerate(self.forward):
+            self.backward[output] = i
+        self.inverse_wiring = ''.join(ALPHABET[i] for i in self.backward)
+        self.shifted_forward = shifted_tables(self.forward)
+        self.shifted_backward = shifted_tables(self.backward)
+
+    def __repr__(self):
+        return 'Wheel ' + self.name + ': ' + self.wiring + (', notches: ' + self.notch if self.notch else '')
+
+class WheelRegistry():
+    '''
+    This class holds the rotors, Greek wheels and reflectors loaded from a wheel file.
+    '''
+
+    def __init__(self, rotors, greek, reflectors):
+        self.rotors = rotors
+        self.greek = greek
+        self.reflectors = reflectors
+        # Reflector tables with a Greek wheel folded in, keyed by (reflector, Greek wheel, wiring shift).
+        self._reflector_tables = {}
+
+    @classmethod
+    def load(cls, path=WHEEL_FILE):
+        '''
+        Reads a wheel file. See wheels.json for the format.
+        '''
+        with open(path, 'r') as f:
+            data = json.load(f)
+        groups = []
+        for group in ('rotors', 'greek', 'reflectors'):
+            groups.append({name: Wheel(name, wheel['wiring'], wheel.get('notches', ''), wheel.get('ring', 'A'))
+                           for name, wheel in data.get(group, {}).items()})
+        for name, wheel in groups[2].items():
+            if any(wheel.forward[i] == i or wheel.forward[wheel.forward[i]] != i for i in range(26)):
+                raise ValueError('Reflector ' + name + ' must swap every letter with a different one.')
+        return cls(*groups)
+
+    def wheel(self, name):
+        '''
+        Returns a rotor or Greek wheel by name. Raises KeyError for unknown names.
+        '''
+        if name in self.rotors:
+            return self.rotors[name]
+        return self.greek[name]
+
+    def wheel_orders(self, count=3, rotors=None):
+        '''
+        Returns every ordering of count rotors drawn from rotors (all stepping rotors by default), e.g. the 336 orders of three out of I - VIII.
+        '''
+        return [list(order) for order in permutations(list(self.rotors) if rotors is None else rotors, count)]
+
+    def valid_order(self, rotor_order):
+        '''
+        True if rotor_order names three stepping rotors, optionally followed by a Greek wheel, each in its own slot.
+        '''
+        return len(rotor_order) in (3, 4) and all(rotor_num in self.rotors for rotor_num in rotor_order[:3]) and \
+            all(rotor_num in self.greek for rotor_num in rotor_order[3:])
+
+    def default_reflector(self, rotor_order):
+        '''
+        Reflector used when none is given: B, or B-thin on a four-rotor machine.
+        '''
+        return 'B-thin' if len(rotor_order) == 4 else 'B'
+
+    def reflector_table(self, reflector='B', greek=None, shift=0):
+        '''
+        Returns the reflector as a list of 26 output indices.
+
+        On a four-rotor machine the Greek wheel never moves, so the path Greek wheel -> thin reflector -> Greek wheel is itself a fixed reflector. greek = the Greek wheel name, shift = its window offset minus its ring offset.
+        '''
+        key = (reflector, greek, shift%26 if greek else 0)
+        if key not in self._reflector_tables:
+            table = self.reflectors[reflector].forward
+            if greek is not None:
+                wheel = self.greek[greek]
+                forward, backward = wheel.shifted_forward[key[2]], wheel.shifted_backward[key[2]]
+                table = [backward[table[forward[i]]] for i in range(26)]
+            self._reflector_tables[key] = list(table)
+        return self._reflector_tables[key]
+
+# Loaded once and shared by components, compiled and batch.
+REGISTRY = WheelRegistry.load()
@@ -0,0 +1,184 @@
+#! /usr/bin/python
+"""
+Module containing Zygalski's sheets, the attack that replaced Rejewski's characteristics (rejewski.py) once the day key stopped being used as the start position for the message keys.
+
+Each message now starts with a setting sent in the clear, such as 'FWS', followed by the message key enciphered twice at that setting, such as 'QRDQXK'. The rotor order, ring settings and plugboard are the secret. When the first and fourth (or second and fifth, or third and sixth) letters of the six are equal, the indicator has a "female". The plugboard cannot create or remove one, so a female can only appear at rotor positions where the two scrambler permutations three keystrokes apart have a letter in common.
+
+Outline:
+
+- A sheet marks, for one rotor order, every rotor position (window offset minus ring offset) where a female is possible. The two positions differ by three steps of the left rotor, and by one step of the middle rotor, or of the middle and right rotors, if the rotors carried in between. So every rotor order has three sheets, one for each of these differences.
+- A sheet is stored as 676 rows of 26 bits, one row per left/middle rotor position, with the right rotor position along the bits in reverse. Shifting a sheet by the setting of an indicator is then a gather of rows plus a rotation of each row. Each cell of the shifted sheet is one ring setting, and the cell's bit says whether that ring setting allows the female.
+- The clear setting gives the window letters, so which rotors carry between the two positions is known for every rotor order. Stacking the sheets is an AND of the shifted rows over every female of the day. Only the true rotor order and ring setting, plus a few accidental matches, keep their bit.
+
+write_sheets builds the sheets for every rotor order once, with a process pool, and saves them to a small file (2.7 MB for the 336 orders of rotors I - VIII). ZygalskiSheets opens that file with mmap, in the same file layout as catalog.ChainCatalog.
+
+As in batch.py, the reflector is B.
+"""
+# Import helpful tools
+from multiprocessing import Pool
+import random as r
+
+import numpy as np
+
+# Import enigma stuff
+import machine
+import batch
+import instrument
+from catalog import MappedFile, write_mapped_file
+from components import ROTOR_WIRINGS, ALPHABET
+from wheels import REGISTRY
+
+MAGIC = b'ENIGZYG1'
+# How far the rotors move between the two letters of a female, one sheet each: no carry, a carry into the middle rotor, and a carry on into the right rotor.
+SHEET_STEPS = [(3, 0, 0), (3, 1, 0), (3, 1, 1)]
+ROW_MASK = (1 << 26) - 1
+
+def female_positions(rotor_order):
+    '''
+    Finds every rotor position where a female is possible, for each entry of SHEET_STEPS.
+
+    Positions are numbered l*676 + m*26 + r by the offsets of the left, middle and right rotor wiring (window offset minus ring offset), as in batch.ALL_KEYS.
+
+    Returns a (3, 17576) boolean array.
+    '''
+    scrambler = batch.order_tables(rotor_order)[0]
+    l, m, r = np.indices((26, 26, 26)).reshape(3, -1)
+    holes = []
+    for dl, dm, dr in SHEET_STEPS:
+        later = scrambler[((l + dl)%26)*676 + ((m + dm)%26)*26 + (r + dr)%26]
+        # A letter that both positions encipher to the same letter can give a female, whatever the plugboard does.
+        holes.append((scrambler == later).any(axis=1))
+    return np.array(holes)
+
+def pack_sheets(holes):
+    '''
+    Packs the output of female_positions into a (3, 26, 26) uint32 array. Bit j of entry [sheet, l, m] is the hole at right rotor position -j (mod 26), so that a rotation turns a row into ring settings (see ZygalskiSheets.female_mask).
+    '''
+    holes = holes.reshape(len(SHEET_STEPS), 26, 26, 26)
+    reverse = holes[..., (-np.arange(26))%26].astype(np.uint64)
+    return (reverse << np.arange(26, dtype=np.uint64)).sum(axis=-1).astype(np.uint32)
+
+def build_sheet(rotor_order):
+    '''
+    Worker task for write_sheets: the packed sheets for one rotor order.
+    '''
+    return pack_sheets(female_positions(rotor_order))
+
+def write_sheets(path='./zygalski.sheets', rotors=list(ROTOR_WIRINGS), workers=None):
+    '''
+    Builds the sheets for every ordering of three of the given rotors and writes them to a sheet file.
+
+    Params: path = file to write.
+            rotors = the rotors whose orderings are covered (all of ROTOR_WIRINGS by default, i.e. 336 orders).
+            workers = number of processes (defaults to the number of CPUs, 1 runs everything in this process).
+    '''
+    orders = REGISTRY.wheel_orders(3, rotors)
+    with instrument.timer('zygalski.build'):
+        if workers == 1:
+            sheets = [build_sheet(order) for order in orders]
+        else:
+            with Pool(workers) as pool:
+                sheets = pool.map(build_sheet, orders)
+    write_mapped_file(path, MAGIC, {'orders': orders, 'steps': SHEET_STEPS}, [np.array(sheets, dtype=np.uint32).ravel()])
+
+def females(indicators):
+    '''
+    Lists the females in a day's indicators as (clear setting, pair) tuples, where pair 0, 1 or 2 means letters 1/4, 2/5 or 3/6 are equal.
+
+    Params: indicators = list of (clear setting, six enciphered letters) pairs such as ('FWS', 'QRDQXK').
+    '''
+    found = []
+    for setting, key_encrypt in indicators:
+        key_encrypt = key_encrypt.upper()
+        for pair in range(3):
+            if key_encrypt[pair] == key_encrypt[pair + 3]:
+                found.append((setting.upper(), pair))
+    return found
+
+class ZygalskiSheets(MappedFile):
+    '''
+    Read-only, memory-mapped view of a sheet file written by write_sheets.
+    '''
+    MAGIC = MAGIC
+    KIND = 'Zygalski sheet'
+
+    def __init__(self, path='./zygalski.sheets'):
+        MappedFile.__init__(self, path)
+        self.orders = [tuple(order) for order in self.header['orders']]
+        self.order_ids = batch.order_ids(self.orders)
+        self.sheets = self.array(len(self.orders)*len(SHEET_STEPS)*676).reshape(len(self.orders), len(SHEET_STEPS), 26, 26)
+
+    def __repr__(self):
+        return 'Zygalski sheets ' + self.path + ': ' + str(len(self)) + ' rotor orders'
+
+    def release(self):
+        # The sheets point into the map, so drop them before closing it.
+        self.sheets = None
+
+    def __len__(self):
+        return len(self.orders)
+
+    def female_mask(self, setting, pair, orders=None):
+        '''
+        Shifts the sheets for one female to its clear setting.
+
+        Returns an (N, 26, 26) uint32 array for the N rotor orders (all of them, or the order numbers in orders): bit r of entry [n, l, m] is set if rings l, m, r allow the female under that rotor order.
+        '''
+        orders = np.arange(len(self.orders)) if orders is None else np.asarray(orders)
+        key = batch.key_offsets([setting])
+        # Window offsets at the two letters of the female, for every rotor order.
+        l, m, right = batch.offsets_at(np.repeat(key, len(orders), axis=0), self.order_ids[orders], [pair + 1, pair + 4])
+        sheet = (m[:, 1] - m[:, 0])%26 + (right[:, 1] - right[:, 0])%26
+        rings = np.arange(26)
+        # The sheet position is the window offset less the ring offset.
+        rows = self.sheets[orders[:, None, None], sheet[:, None, None], (l[:, 0, None] - rings)[:, :, None]%26,
+                           (m[:, 0, None] - rings)[:, None, :]%26].astype(np.uint64)
+        shift = right[:, 0, None, None].astype(np.uint64)
+        return (((rows << shift) | (rows >> (np.uint64(26) - shift))) & np.uint64(ROW_MASK)).astype(np.uint32)
+
+    def stack(self, indicators):
+        '''
+        Lays the sheets of every female in the indicators on top of each other.
+
+        Returns (order numbers, masks): the rotor orders with at least one ring setting left, and their (N, 26, 26) masks as in female_mask.
+        '''
+        orders = np.arange(len(self.orders))
+        masks = np.full((len(orders), 26, 26), ROW_MASK, dtype=np.uint32)
+        for setting, pair in females(indicators):
+            masks &= self.female_mask(setting, pair, orders)
+            # Drop rotor orders with nothing left, so later females only shift the sheets still in play.
+            alive = masks.any(axis=(1, 2))
+            orders, masks = orders[alive], masks[alive]
+            if len(orders) == 0:
+                break
+        return orders, masks
+
+    def query(self, indicators):
+        '''
+        Returns the (rotor order, ring settings) pairs that fit every female in the indicators, e.g. [(('II', 'I', 'III'), 'KDM')].
+        '''
+        orders, masks = self.stack(indicators)
+        survivors = []
+        for n, l, m in zip(*np.nonzero(masks)):
+            row = int(masks[n, l, m])
+            for right in range(26):
+                if row >> right & 1:
+                    survivors.append((self.orders[orders[n]], ALPHABET[l] + ALPHABET[m] + ALPHABET[right]))
+        if instrument.enabled:
+            instrument.count('candidates.tested', len(self.orders)*26**3)
+        return survivors
+
+############################## CODE TO GENERATE INDICATORS FROM DAY KEY ##############################
+
+def make_indicators(rotor_order, rings, swaps, count):
+    '''
+    Given the secret settings for the Enigma machine, generate a day's indicators: a random clear setting and a random message key enciphered twice at that setting.
+    '''
+    indicators = []
+    enigma = machine.Enigma('AAA', swaps, rotor_order, rings=rings)
+    for i in range(count):
+        setting = ''.join(ALPHABET[r.randint(0, 25)] for j in range(3))
+        msg_key = ''.join(ALPHABET[r.randint(0, 25)] for j in range(3))
+        enigma.set_rotor_position(setting)
+        indicators.append((setting, enigma.encipher(msg_key + msg_key)))
+    return indicators